@@ -6,25 +6,20 @@ Created on Mon Dec  9 18:31:53 2019
 """
 
 import time
-import matplotlib.pyplot as plt
 import numpy as np
-from pycuda import driver, compiler, gpuarray, tools
-
-import pycuda.autoinit
+from compact import gram, project
+from profiling import data_bytes, phase
 
 def s_maxind(A,size,k):
     #function to find index of maximum element in each row 
-    t0 = time.time()
     m1 = k + 1
     for i in range(k+2,size):
         if(abs(A[k][i])>abs(A[k][m1])):
             m1 = i
-    t1 = time.time()
     return m1
         
 def s_update(k,t,e,changed,state):
     #function to update state of changed eigenvalue and its corresponding state
-    t0 = time.time()
     y = e[k]
     e[k] = y + t
     if (changed[k]==True and y == e[k]):
@@ -33,16 +28,216 @@ def s_update(k,t,e,changed,state):
     elif (changed[k]==False and y!=e[k]):
         changed[k] = True
         state += 1
-    t1 = time.time()
     return changed, state
 
 def s_rotate(k,l,i,j,A,c,s):
     #function to rotate matrix according to given sine and cos functions
-    t0 = time.time()
     kl = c * A[k][l] - s * A[i][j]
     ij = s * A[k][l] + c * A[i][j]
     A[k][l] = kl
     A[i][j] = ij
+    return A
+
+
+def s_sort(e, E, N):
+    #sort eigenvalues of D_T*D (D is NxP) in descending order, permute the
+    #eigenvectors to match and mask singular values that are zero to
+    #working precision; returns sigma, U and inv_sigma
+    P = len(e)
+    with phase('sort/permute', nbytes = 2 * E.nbytes):
+        order = np.argsort(e)[::-1]
+        U = E[:, order]
+        #singular values of D; round-off can leave tiny negative eigenvalues
+        sigma = np.sqrt(np.clip(e[order], 0, None))
+    inv_sigma = np.zeros_like(sigma)
+    if P > 0 and sigma[0] > 0:
+        tol = max(N, P) * np.finfo(sigma.dtype).eps * sigma[0]
+        nonzero = sigma > tol
+        inv_sigma[nonzero] = 1.0 / sigma[nonzero]
+    return sigma, U, inv_sigma
+
+def s_scale(VT, inv_sigma, N, full_matrices=True):
+    #VT = inv(SIGMA) * U_T * D_T from the (P, N) product U_T * D_T; the
+    #diagonal scaling is broadcast in place so only one (P, N) array is
+    #allocated, then padded to the (N, N) layout of the original
+    #implementation when full_matrices
+    VT *= inv_sigma[:, None]
+    if full_matrices:
+        P = VT.shape[0]
+        VT_full = np.zeros((N, N), dtype = VT.dtype)
+        VT_full[:min(N, P)] = VT[:min(N, P)]
+        VT = VT_full
+    return VT
+
+def s_postprocess(e, E, D, full_matrices=True, tile_rows=4096, k=None):
+    #function to turn eigenpairs of D_T*D into the SVD factors of D;
+    #tile_rows is the row tile of compact / sparse D in the projection;
+    #k keeps the k leading triplets and projects D on those only
+    N, P = D.shape
+    sigma, U, inv_sigma = s_sort(e, E, N)
+    if k is not None:
+        sigma, U, inv_sigma = sigma[:k], U[:, :k], inv_sigma[:k]
+    #compact (float16 / bfloat16) D is upcast tile by tile
+    with phase('V_T', flops = 2.0 * N * P * U.shape[1], nbytes = data_bytes(D) + N * U.shape[1] * U.itemsize):
+        VT = s_scale(project(D, U, tile_rows).T, inv_sigma, N, full_matrices)
+    return sigma, U, VT
+
+def s_driver(solver, D, full_matrices=True, covariance=None, tile_rows=4096, k=None, **options):
+    #shared body of the svd_pca_* drivers: solver(covariance(D), **options)
+    #returns eigenpairs (e, E, count) of D_T*D and s_postprocess turns them
+    #into sigma, U (PxP) and VT (PxN, or zero padded NxN when
+    #full_matrices), the k leading triplets only when k is given;
+    #covariance defaults to the Gram matrix of compact.gram.
+    #Returns sigma, U, VT and the time spent after the covariance stage
+    if covariance is None:
+        As = gram(D, tile_rows)
+    else:
+        As = covariance(D)
+    t0 = time.time()
+    e, E, count = solver(As, **options)
+    sigma, U, VT = s_postprocess(e, E, D, full_matrices, tile_rows, k)
     t1 = time.time()
+    return sigma, U, VT, t1-t0
+
+def s_active(A, tol):
+    #indices that still have an off-diagonal entry above the cyclic Jacobi
+    #threshold tol*sqrt(|a_kk a_ll|); only the upper triangle is read
+    d = np.sqrt(np.abs(np.diag(A)))
+    big = np.triu(np.abs(A) > tol * np.outer(d, d), 1)
+    return np.flatnonzero(big.any(axis = 0) | big.any(axis = 1))
+
+def s_rotate_vec(A,k,l,c,s):
+    #vectorized form of the three s_rotate loops of jacobi_serial: rotate
+    #the upper triangle entries of rows/columns k and l (k < l)
+    ik, il = A[:k, k].copy(), A[:k, l].copy()
+    A[:k, k] = c * ik - s * il
+    A[:k, l] = s * ik + c * il
+    kj, jl = A[k, k+1:l].copy(), A[k+1:l, l].copy()
+    A[k, k+1:l] = c * kj - s * jl
+    A[k+1:l, l] = s * kj + c * jl
+    kz, lz = A[k, l+1:].copy(), A[l, l+1:].copy()
+    A[k, l+1:] = c * kz - s * lz
+    A[l, l+1:] = s * kz + c * lz
     return A
 
+class PivotTree:
+    #tournament tree over the rows of the upper triangle of A. Leaf i holds
+    #max_{j>i} |A[i][j]| (its column is kept in col[i]); every internal
+    #node holds the row that wins the match between its children, so the
+    #global pivot sits at the root and repairing a leaf costs O(log P)
+    def __init__(self, A):
+        P = A.shape[0]
+        self.P = P
+        self.size = 1 << max(P - 1, 1).bit_length()
+        self.val = np.full(self.size, -1.0)
+        self.col = np.zeros(P, dtype = np.int64)
+        self.win = np.zeros(2 * self.size, dtype = np.int64)
+        self.win[self.size:] = np.arange(self.size)
+        rows = np.arange(P)
+        self.val[rows], self.col[rows] = self._row_max(A, rows)
+        #play all matches bottom up, one tree level at a time
+        for level in range(self.size.bit_length() - 2, -1, -1):
+            nodes = np.arange(1 << level, 2 << level)
+            self._play(nodes)
+    
+    def _row_max(self, A, rows):
+        #vectorized max and argmax of |A[i][j]| over j > i for the given rows
+        B = np.abs(A[rows])
+        B[np.arange(self.P)[None, :] <= rows[:, None]] = -1
+        cols = B.argmax(axis = 1)
+        return B[np.arange(len(rows)), cols], cols
+    
+    def _play(self, nodes):
+        left, right = self.win[2 * nodes], self.win[2 * nodes + 1]
+        self.win[nodes] = np.where(self.val[right] > self.val[left], right, left)
+    
+    def _set(self, rows):
+        #replay the matches on the paths from the given leaves to the root;
+        #paths that merge are simply replayed twice with the same result
+        nodes = (self.size + rows) >> 1
+        while nodes[0] > 0:
+            self._play(nodes)
+            nodes >>= 1
+    
+    def pivot(self):
+        #row and column of the largest off-diagonal element
+        k = self.win[1]
+        return k, self.col[k]
+    
+    def repair(self, A, k, l):
+        #after rotating (k, l), rows k and l changed entirely and every row
+        #i < l changed in column l (and in column k if i < k)
+        rows = np.arange(l)
+        vals, cols = self.val[:l], self.col[:l]
+        cand_l = np.abs(A[:l, l])
+        cand_k = np.abs(A[:l, k])
+        cand_k[k:] = -1
+        #rows whose maximum was at column k or l may have lost it
+        stale = (cols == k) | (cols == l)
+        stale[k] = True
+        up_l = (cand_l > vals) & (cand_l >= cand_k) & ~stale
+        up_k = (cand_k > vals) & (cand_k > cand_l) & ~stale
+        vals[up_l], cols[up_l] = cand_l[up_l], l
+        vals[up_k], cols[up_k] = cand_k[up_k], k
+        stale = np.append(rows[stale], l)
+        self.val[stale], self.col[stale] = self._row_max(A, stale)
+        self._set(np.concatenate([rows[up_l | up_k], stale]))
+
+class RotationLog:
+    #deferred eigenvector accumulation. add() records rotations (k, l, c, s)
+    #(scalars, or arrays of disjoint pairs for a whole round) instead of
+    #rewriting columns k and l of E for each one. Once the columns touched
+    #would exceed width, the logged rotations are composed into a small
+    #orthogonal block Q and applied with one GEMM, E[:, I] <- E[:, I] Q.
+    #Batches wider than width on their own are applied to E directly.
+    #flush(E) must be called before E is read.
+    def __init__(self, width=64, dot=np.dot):
+        self.width = width
+        self.dot = dot
+        self.pos = {}
+        self.log = []
+        self.flushes = 0
+    
+    def add(self, E, k, l, c, s):
+        pos = self.pos
+        if np.ndim(k) == 0:
+            #single rotation: plain Python bookkeeping
+            k, l = int(k), int(l)
+            if len(pos) + (k not in pos) + (l not in pos) > self.width:
+                self.flush(E)
+            kp = pos.setdefault(k, len(pos))
+            lp = pos.setdefault(l, len(pos))
+            self.log.append((kp, lp, c, s))
+            return
+        if len(k) * 2 > self.width:
+            self.flush(E)
+            Ek, El = E[:, k], E[:, l]
+            E[:, k] = Ek * c - El * s
+            E[:, l] = Ek * s + El * c
+            return
+        kl = np.concatenate([k, l]).tolist()
+        if len(pos) + sum(1 for i in kl if i not in pos) > self.width:
+            self.flush(E)
+        kp = np.array([pos.setdefault(i, len(pos)) for i in kl])
+        self.log.append((kp[:len(k)], kp[len(k):], c, s))
+    
+    def flush(self, E):
+        if not self.log:
+            return E
+        idx = np.fromiter(self.pos, dtype = np.int64, count = len(self.pos))
+        #compose Q_T row by row (contiguous rows, views for scalar pairs)
+        QT = np.eye(len(idx), dtype = E.dtype)
+        for k, l, c, s in self.log:
+            if np.ndim(k) == 0:
+                Qk = QT[k].copy()
+                QT[k] = c * Qk - s * QT[l]
+                QT[l] = s * Qk + c * QT[l]
+            else:
+                Qk, Ql = QT[k], QT[l]
+                QT[k] = c[:, None] * Qk - s[:, None] * Ql
+                QT[l] = s[:, None] * Qk + c[:, None] * Ql
+        E[:, idx] = self.dot(E[:, idx], QT.T)
+        self.pos.clear()
+        self.log = []
+        self.flushes += 1
+        return E
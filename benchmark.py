@@ -0,0 +1,229 @@
+"""
+Benchmark harness for the CPU engines, with numpy.linalg.svd as baseline.
+
+Every case is a D with known singular values (logspace from 1 down to
+1/cond, random orthogonal factors) of a given shape, dtype and condition
+number; batched cases decompose `batch` such matrices one after another.
+For every engine the harness records the best time of `repeats` runs,
+sweeps and rotations where the solver counts them, the peak bytes
+allocated during one extra traced run (tracemalloc, which sees NumPy's
+buffers) and three accuracy figures: max |sigma - sigma_true| / sigma_1,
+the reconstruction residual ||D - VT_T diag(sigma) U_T|| / ||D|| and the
+orthogonality error of U.
+
+    python benchmark.py run -o results.json [--quick] [--engines cyclic,block]
+    python benchmark.py compare results.json baseline.json [--time-tol 0.25]
+
+compare exits with status 1 when a case got slower than the baseline by
+more than time-tol (relative, ignoring differences under 5 ms), its
+accuracy got worse by more than acc-factor, or a baseline case is missing
+from the current run (a dropped or skipped engine); cases that are new
+in the current run are listed but pass. No GPU is needed.
+"""
+
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from Helper import s_postprocess
+from compact import gram
+
+
+def _serial(D):
+    from v1 import jacobi_serial
+    P = D.shape[1]
+    e, E, rotations = jacobi_serial(gram(D))
+    # rotations of a classical Jacobi "sweep" of P(P-1)/2 pivots
+    return e, E, {'sweeps': rotations / max(P * (P - 1) // 2, 1), 'rotations': rotations}
+
+
+def _cyclic(D):
+    from svd_cyclic import cyclic_jacobi
+    stats = {}
+    e, E, sweeps = cyclic_jacobi(gram(D), stats = stats)
+    return e, E, {'sweeps': sweeps, 'rotations': stats['rotations']}
+
+
+def _block(D):
+    from svd_block import block_jacobi
+    stats = {}
+    e, E, sweeps = block_jacobi(gram(D), stats = stats)
+    return e, E, {'sweeps': sweeps, 'subproblems': stats['subproblems']}
+
+
+def _packed(D):
+    from packed import packed_gram, packed_jacobi
+    e, E, sweeps = packed_jacobi(packed_gram(D), D.shape[1])
+    return e, E, {'sweeps': sweeps}
+
+
+def _mixed(D):
+    from mixed import mixed_jacobi
+    stats = {}
+    e, E, sweeps = mixed_jacobi(gram(D, dtype = np.float64), stats = stats)
+    return e, E, {'sweeps': stats['bulk_sweeps'] + sweeps, 'refine_sweeps': sweeps}
+
+
+def _tsqr(D):
+    from tsqr import one_sided_jacobi, tsqr
+    stats = {}
+    R, _ = tsqr(D)
+    e, E, sweeps = one_sided_jacobi(R, stats = stats)
+    return e, E, {'sweeps': sweeps, 'rotations': stats['rotations']}
+
+
+# name -> function returning eigenpairs of D_T D and the solver counters
+ENGINES = {'serial': _serial, 'cyclic': _cyclic, 'block': _block, 'packed': _packed,
+           'mixed': _mixed, 'tsqr': _tsqr, 'numpy': None}
+
+# largest P each engine is run at (the serial solver is a Python loop)
+MAX_P = {'serial': 64}
+
+
+def _decompose(engine, D):
+    # sigma, U, VT in the layout of the svd_pca_* drivers, and counters
+    if engine == 'numpy':
+        u, sigma, vh = np.linalg.svd(D, full_matrices = False)
+        return sigma, vh.T, u.T, {}
+    e, E, counters = ENGINES[engine](D)
+    sigma, U, VT = s_postprocess(e, E, D, full_matrices = False)
+    return sigma, U, VT, counters
+
+
+def make_case(N, P, dtype=np.float64, cond=1e6, seed=0, s=None, blocks=1):
+    # D = Q1 diag(s) Q2_T with random orthogonal Q1, Q2; s defaults to
+    # min(N, P) values logspaced from 1 to 1/cond. blocks > 1 makes Q2
+    # block-diagonal, so D_T D splits into that many independent blocks.
+    # Returns D, s and the right singular vectors Q2 (validate.py and
+    # tests/ build their matrices here too)
+    rng = np.random.RandomState(seed)
+    k = min(N, P)
+    s = np.logspace(0, -np.log10(cond), k) if s is None else np.asarray(s, dtype = np.float64)
+    Q1 = np.linalg.qr(rng.randn(N, k))[0]
+    if blocks == 1:
+        Q2 = np.linalg.qr(rng.randn(P, k))[0]
+    else:
+        Q2 = np.zeros((P, P))
+        for b in np.array_split(np.arange(P), blocks):
+            Q2[np.ix_(b, b)] = np.linalg.qr(rng.randn(len(b), len(b)))[0]
+        Q2 = Q2[:, :k]
+    return np.dot(Q1 * s, Q2.T).astype(dtype), s, Q2
+
+
+def grid(quick=False):
+    # (name, N, P, batch) x dtypes x condition numbers
+    if quick:
+        shapes = [('square', 32, 32, 1), ('tall', 512, 32, 1), ('batched', 64, 16, 4)]
+        conds = (1e2,)
+    else:
+        shapes = [('square', 64, 64, 1), ('square', 128, 128, 1), ('tall', 2048, 64, 1),
+                  ('batched', 128, 32, 8)]
+        conds = (1e2, 1e6)
+    return [dict(shape = name, N = N, P = P, batch = batch, dtype = np.dtype(dtype).name, cond = cond)
+            for name, N, P, batch in shapes for dtype in (np.float32, np.float64) for cond in conds]
+
+
+def case_id(case):
+    return "%(shape)s-%(N)dx%(P)d-b%(batch)d-%(dtype)s-c%(cond).0e" % case
+
+
+def run_case(case, engine, repeats=3):
+    Ds = [make_case(case['N'], case['P'], case['dtype'], case['cond'], seed)[:2] for seed in range(case['batch'])]
+    best = np.inf
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = [_decompose(engine, D) for D, _ in Ds]
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    for D, _ in Ds:
+        _decompose(engine, D)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = dict(case, id = case_id(case), engine = engine, time = best, peak_bytes = peak,
+                  sigma_err = 0.0, residual = 0.0, orthogonality = 0.0)
+    for (D, s_true), (sigma, U, VT, counters) in zip(Ds, out):
+        k = len(s_true)
+        D64, sigma, U, VT = (np.asarray(X, dtype = np.float64) for X in (D, sigma, U, VT))
+        approx = np.dot(VT[:k].T * sigma[:k], U[:, :k].T)
+        result['sigma_err'] = max(result['sigma_err'], np.abs(sigma[:k] - s_true).max() / s_true[0])
+        result['residual'] = max(result['residual'], np.linalg.norm(D64 - approx) / np.linalg.norm(D64))
+        result['orthogonality'] = max(result['orthogonality'], np.abs(np.dot(U.T, U) - np.eye(U.shape[1])).max())
+        for name, value in counters.items():
+            result[name] = result.get(name, 0) + value
+    return result
+
+
+def run(engines=None, quick=False, repeats=3, log=sys.stderr):
+    engines = list(ENGINES) if engines is None else engines
+    results = []
+    for case in grid(quick):
+        for engine in engines:
+            if case['P'] > MAX_P.get(engine, case['P']):
+                continue
+            result = run_case(case, engine, repeats)
+            results.append(result)
+            if log is not None:
+                log.write("%-32s %-7s %8.4fs  err %.1e\n" % (result['id'], engine, result['time'], result['sigma_err']))
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def compare(current, baseline, time_tol=0.25, acc_factor=10.0, min_time=5e-3):
+    # regressions of current against baseline and the cases of current
+    # that have no baseline, both as readable strings
+    base = dict(((r['id'], r['engine']), r) for r in baseline['results'])
+    seen = set((r['id'], r['engine']) for r in current['results'])
+    regressions = ["%s %s: missing from the current run" % key for key in base if key not in seen]
+    added = []
+    for r in current['results']:
+        name = "%s %s" % (r['id'], r['engine'])
+        b = base.get((r['id'], r['engine']))
+        if b is None:
+            added.append("%s: new, no baseline" % name)
+            continue
+        if r['time'] > b['time'] * (1 + time_tol) and r['time'] - b['time'] > min_time:
+            regressions.append("%s: time %.4fs, baseline %.4fs" % (name, r['time'], b['time']))
+        # floor at the dtype's epsilon so noise at round-off level passes
+        eps = np.finfo(r['dtype']).eps
+        for metric in ('sigma_err', 'residual', 'orthogonality'):
+            if r[metric] > acc_factor * max(b[metric], eps):
+                regressions.append("%s: %s %.1e, baseline %.1e" % (name, metric, r[metric], b[metric]))
+    return regressions, added
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description = "benchmark the CPU SVD engines")
+    sub = parser.add_subparsers(dest = 'mode', required = True)
+    p_run = sub.add_parser('run')
+    p_run.add_argument('-o', '--output', default = 'benchmark.json')
+    p_run.add_argument('--engines', default = ','.join(ENGINES))
+    p_run.add_argument('--quick', action = 'store_true')
+    p_run.add_argument('--repeats', type = int, default = 3)
+    p_cmp = sub.add_parser('compare')
+    p_cmp.add_argument('current')
+    p_cmp.add_argument('baseline')
+    p_cmp.add_argument('--time-tol', type = float, default = 0.25)
+    p_cmp.add_argument('--acc-factor', type = float, default = 10.0)
+    args = parser.parse_args()
+
+    if args.mode == 'run':
+        report = run(args.engines.split(','), args.quick, args.repeats)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1)
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, added = compare(current, baseline, args.time_tol, args.acc_factor)
+        for line in regressions + added:
+            print(line)
+        print("%d regression(s), %d new case(s)" % (len(regressions), len(added)))
+        sys.exit(1 if regressions else 0)
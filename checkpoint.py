@@ -0,0 +1,32 @@
+"""
+Solver snapshots for checkpoint / resume.
+
+A snapshot is a single .npy file holding one record of a structured dtype,
+one field per state array (A, eigenvectors, counters, ...). It is filled
+through a memory map of a temporary file, flushed and renamed over the
+previous snapshot, so a preempted job always finds either the old or the
+new state intact. Resuming from a snapshot restores the arrays bit for bit.
+"""
+
+import os
+
+import numpy as np
+
+
+def save_snapshot(path, **state):
+    # write `state` (name -> array or scalar) atomically to `path`
+    state = dict((name, np.asarray(value)) for name, value in state.items())
+    dtype = np.dtype([(name, value.dtype, value.shape) for name, value in state.items()])
+    tmp = path + '.tmp'
+    snap = np.lib.format.open_memmap(tmp, mode = 'w+', dtype = dtype, shape = (1,))
+    for name, value in state.items():
+        snap[0][name] = value
+    snap.flush()
+    del snap
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    # name -> array; scalars come back as 0-d arrays
+    snap = np.load(path, mmap_mode = 'r')
+    return dict((name, np.array(snap[0][name])) for name in snap.dtype.names)
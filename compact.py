@@ -0,0 +1,159 @@
+"""
+Compact (16-bit) storage for the data matrix D.
+
+D may be stored as float16, or as bfloat16 held in a BFloat16 array: a
+uint16 array of bit patterns (the upper half of a float32; NumPy has no
+bfloat16 dtype) marked by its type, so a plain uint16 D (counts, pixels)
+stays integer data. Make one with compress(D, 'bfloat16'), or wrap stored
+bits with as_bfloat16() (np.save keeps only the uint16 bits). The
+Gram (D_T D) and projection (D U) stages upcast D one tile of rows at a
+time into float32 / float64 accumulators, so the 16-bit copy is the only
+full-size array and the P x P solve is unchanged. Memory and disk use of
+D are halved compared to float32.
+
+Error bounds. Rounding D to a format with unit roundoff u perturbs every
+entry by at most u relative, |dD| <= u |D|, so ||dD||_F <= u ||D||_F and
+by Weyl's inequality every singular value moves by at most
+
+    |sigma~_i - sigma_i| <= ||dD||_2 <= u ||D||_F
+
+(u = 2^-11 ~ 4.9e-4 for float16, 2^-8 ~ 3.9e-3 for bfloat16). The
+eigenvalues of D_T D move by at most (2u + u^2) ||D||_2 ||D||_F, and the
+leading singular subspaces by that amount over the spectral gap
+(Davis-Kahan). With float64 accumulation the Gram stage adds nothing
+noticeable on top; float32 accumulation adds about N eps32 ||D||_F^2 in
+the worst case. float16 only covers |x| < 65504 and loses relative
+precision below 6.1e-5 (subnormals), so scale D into that range first;
+bfloat16 has the float32 range. sigma_bound() evaluates the bound from
+the compact copy.
+"""
+
+import numpy as np
+
+from profiling import data_bytes, phase
+from sparse_input import is_sparse, sparse_gram, sparse_project
+
+
+UNIT_ROUNDOFF = {'float16': 2.0**-11, 'bfloat16': 2.0**-8}
+
+
+class BFloat16(np.ndarray):
+    # uint16 array of bfloat16 bit patterns; slices and transposes keep the
+    # type, arithmetic on it is meaningless (decode with from_bfloat16)
+    pass
+
+
+def as_bfloat16(B):
+    # mark a uint16 array of bfloat16 bit patterns as such (no copy)
+    B = np.asarray(B)
+    if B.dtype != np.uint16:
+        raise ValueError("bfloat16 bit patterns must be uint16, got %s" % (B.dtype,))
+    return B.view(BFloat16)
+
+
+def to_bfloat16(X):
+    # float32 -> bfloat16 bit patterns (BFloat16), round to nearest even
+    bits = np.ascontiguousarray(X, dtype = np.float32).view(np.uint32)
+    bits = bits + (np.uint32(0x7FFF) + ((bits >> 16) & 1))
+    return as_bfloat16((bits >> 16).astype(np.uint16))
+
+
+def from_bfloat16(B):
+    # bfloat16 bit patterns -> float32 (exact)
+    return (np.asarray(B, dtype = np.uint32) << 16).view(np.float32)
+
+
+def compress(D, fmt='float16'):
+    # 16-bit copy of D: a float16 array or a BFloat16 array
+    if fmt == 'float16':
+        return np.asarray(D, dtype = np.float16)
+    if fmt == 'bfloat16':
+        return to_bfloat16(D)
+    raise ValueError("unknown compact format %r" % (fmt,))
+
+
+def compact_format(D):
+    # 'float16', 'bfloat16' or None for a full precision D
+    if D.dtype == np.float16:
+        return 'float16'
+    if isinstance(D, BFloat16) and D.dtype == np.uint16:
+        return 'bfloat16'
+    return None
+
+
+def upcast(X, dtype=np.float32):
+    # a tile of D in dtype; bfloat16 tiles are decoded first
+    if compact_format(X) == 'bfloat16':
+        X = from_bfloat16(X)
+    return np.asarray(X, dtype = dtype)
+
+
+def gram(D, tile_rows=4096, dtype=None):
+    # D_T D. Full precision D goes straight to np.dot (in dtype if given);
+    # compact, integer and scipy.sparse D are accumulated in float64 (tile
+    # by tile / in sparse row chunks) and returned in dtype (float32 by
+    # default, like the float32 pipelines expect). Timed as the
+    # 'covariance' phase of profiling.py
+    N, P = D.shape
+    with phase('covariance', flops = 2.0 * getattr(D, 'nnz', N * P) * P, nbytes = data_bytes(D)):
+        if is_sparse(D):
+            return sparse_gram(D, tile_rows).astype(np.float32 if dtype is None else dtype, copy = False)
+        if compact_format(D) is None and D.dtype.kind in 'fc':
+            if dtype is None:
+                return np.dot(D.T, D)
+            D = np.asarray(D, dtype = dtype)
+            return np.dot(D.T, D)
+        G = np.zeros((P, P))
+        for start in range(0, D.shape[0], tile_rows):
+            X = upcast(D[start:start + tile_rows], np.float64)
+            G += np.dot(X.T, X)
+        return G.astype(np.float32 if dtype is None else dtype, copy = False)
+
+
+def project(D, U, tile_rows=4096, dtype=None):
+    # D U, upcasting compact D one tile of rows at a time (each output entry
+    # is a single length-P dot product, so float32 is accurate enough);
+    # scipy.sparse D uses the sparse-dense product
+    if is_sparse(D):
+        return sparse_project(D, U)
+    if compact_format(D) is None:
+        return np.dot(D, U)
+    dtype = np.result_type(U.dtype, np.float32) if dtype is None else dtype
+    out = np.empty((D.shape[0], U.shape[1]), dtype = dtype)
+    for start in range(0, D.shape[0], tile_rows):
+        out[start:start + tile_rows] = np.dot(upcast(D[start:start + tile_rows], dtype), U)
+    return out
+
+
+def sigma_bound(D, tile_rows=4096):
+    # bound on |sigma~_i - sigma_i| from storing D compactly, u ||D||_F,
+    # evaluated from the compact copy (||D||_F <= ||D~||_F / (1 - u))
+    fmt = compact_format(D)
+    if fmt is None:
+        return 0.0
+    u = UNIT_ROUNDOFF[fmt]
+    fro2 = 0.0
+    for start in range(0, D.shape[0], tile_rows):
+        fro2 += np.sum(upcast(D[start:start + tile_rows], np.float64) ** 2)
+    return u * np.sqrt(fro2) / (1 - u)
+
+
+if __name__ == '__main__':
+    # compact against full precision D: singular value error of the host
+    # cyclic SVD against the bound, and leading subspace agreement. The
+    # solvers see the imported module's BFloat16, not this __main__ copy
+    from compact import compress, sigma_bound
+    from svd_cyclic import svd_pca_cyclic
+    np.random.seed(1)
+    N, P, k = 4000, 64, 8
+    D = np.dot(np.random.randn(N, P) * np.logspace(0, -2, P), np.linalg.qr(np.random.randn(P, P))[0])
+    D = D.astype(np.float32)
+    s_ref, U_ref, _, _ = svd_pca_cyclic(N, P, D, full_matrices = False)
+    print("format    bytes(MiB)  max |dsigma|  bound     subspace err (k=%d)" % k)
+    for fmt in ('float16', 'bfloat16'):
+        Dc = compress(D, fmt)
+        s, U, VT, _ = svd_pca_cyclic(N, P, Dc, full_matrices = False)
+        # distance between the leading k dimensional subspaces
+        sub = np.linalg.norm(np.dot(U[:, :k], U[:, :k].T) - np.dot(U_ref[:, :k], U_ref[:, :k].T), 2)
+        print("%-9s %-11.2f %-13.2e %-9.2e %.1e" % (fmt, Dc.nbytes / 2**20, np.abs(s - s_ref).max(), sigma_bound(Dc), sub))
+    print("float32   %-11.2f" % (D.nbytes / 2**20))
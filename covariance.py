@@ -0,0 +1,191 @@
+"""
+Covariance stage for PCA.
+
+Computes the centered (optionally standardized) covariance matrix of D in
+a single pass over row chunks without materializing a centered copy of D.
+Each chunk is reduced to its row count, column means and centered Gram
+matrix in float64, and chunks are combined with Chan et al.'s pairwise
+update, which keeps float32 input numerically stable. The P x P result
+can be handed straight to v1.jacobi_serial or svd_cuda.cudaJacobi.
+
+For data stored in .npy files the reduced statistics can be checkpointed
+next to the source (see file_stats), so reruns with different solver
+settings skip the pass over D.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from compact import upcast
+from profiling import data_bytes, phase
+from sparse_input import is_sparse, sparse_chunk_stats
+
+
+class CovarianceStats:
+    """
+    Running row count n, column means and centered scatter matrix M2 of a
+    stream of row chunks, all accumulated in float64.
+    """
+
+    def __init__(self, P):
+        self.n = 0
+        self.mean = np.zeros(P)
+        self.M2 = np.zeros((P, P))
+
+    @classmethod
+    def from_chunk(cls, X):
+        # statistics of a single chunk; only a chunk-sized float64 copy is
+        # made (compact float16 / bfloat16 chunks are decoded here). Sparse
+        # chunks stay sparse, see sparse_input.py
+        if is_sparse(X):
+            stats = cls(X.shape[1])
+            stats.n, stats.mean, stats.M2 = sparse_chunk_stats(X)
+            return stats
+        X = upcast(X, np.float64)
+        stats = cls(X.shape[1])
+        stats.n = X.shape[0]
+        if stats.n:
+            stats.mean = X.mean(axis = 0)
+            X = X - stats.mean
+            stats.M2 = np.dot(X.T, X)
+        return stats
+
+    def merge(self, other):
+        # Chan/Golub/LeVeque pairwise update: combine two sets of statistics
+        # as if they had been computed over the concatenated rows
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.M2 = other.n, other.mean.copy(), other.M2.copy()
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.n / n)
+        self.M2 = self.M2 + other.M2 + np.outer(delta, delta) * (self.n * other.n / n)
+        self.n = n
+        return self
+
+    def update(self, X):
+        return self.merge(CovarianceStats.from_chunk(X))
+
+    def remove(self, other):
+        # inverse of merge: the statistics of the rows that remain once the
+        # rows summarized by other are taken out again. Every term stays
+        # centered, so a large common mean does not cancel digits
+        if other.n == 0:
+            return self
+        n = self.n - other.n
+        if n <= 0:
+            self.n, self.mean, self.M2 = 0, np.zeros_like(self.mean), np.zeros_like(self.M2)
+            return self
+        mean = self.mean + (self.mean - other.mean) * (other.n / n)
+        delta = other.mean - mean
+        self.M2 = self.M2 - other.M2 - np.outer(delta, delta) * (n * other.n / self.n)
+        self.mean = mean
+        self.n = n
+        return self
+
+    def covariance(self, ddof=1, standardize=False):
+        C = self.M2 / max(self.n - ddof, 1)
+        if standardize:
+            # correlation matrix; constant columns are left at zero
+            std = np.sqrt(np.diag(C))
+            inv = np.zeros_like(std)
+            inv[std > 0] = 1.0 / std[std > 0]
+            C = C * np.outer(inv, inv)
+        return C
+
+
+def covariance_stats(D, chunk_rows=4096):
+    # Reduce D chunk by chunk. Chunk statistics are merged pairwise like a
+    # binary counter (equal sized partial results are combined first), so
+    # the rounding error grows with log(N / chunk_rows) rather than N and
+    # at most log2(N / chunk_rows) partial results are alive at once.
+    # Timed as the 'covariance' phase of profiling.py
+    N, P = D.shape
+    if is_sparse(D):
+        # row chunks of CSC would rescan every column
+        D = D.tocsr()
+    with phase('covariance', flops = 2.0 * getattr(D, 'nnz', N * P) * P, nbytes = data_bytes(D)):
+        stack = []
+        for start in range(0, N, chunk_rows):
+            stats = CovarianceStats.from_chunk(D[start:start + chunk_rows])
+            level = 0
+            while stack and stack[-1][0] == level:
+                stats = stack.pop()[1].merge(stats)
+                level += 1
+            stack.append((level, stats))
+
+        total = CovarianceStats(P)
+        while stack:
+            total = stack.pop()[1].merge(total)
+    return total
+
+
+def covariance(D, chunk_rows=4096, ddof=1, standardize=False):
+    """
+    Centered covariance matrix of the rows of D (N x P) in one pass.
+
+    Returns the P x P float64 covariance (the correlation matrix when
+    standardize=True) and the CovarianceStats holding n and the column
+    means.
+    """
+    stats = covariance_stats(D, chunk_rows)
+    return stats.covariance(ddof, standardize), stats
+
+
+def dataset_fingerprint(path, samples=16, sample_bytes=4096):
+    # identity of a data file: path, size, mtime and a hash of `samples`
+    # evenly spaced blocks of its content. Cheap even for huge files and
+    # catches in-place rewrites that keep the size and mtime.
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size = 20)
+    h.update(repr((os.path.abspath(path), st.st_size, st.st_mtime_ns)).encode())
+    with open(path, 'rb') as f:
+        step = max(st.st_size // samples, 1)
+        for offset in range(0, st.st_size, step):
+            f.seek(offset)
+            h.update(f.read(sample_bytes))
+    return h.hexdigest()
+
+
+def file_stats(path, chunk_rows=4096, checkpoint=True):
+    """
+    CovarianceStats of the .npy matrix stored at `path`, reduced chunk by
+    chunk from a memory map.
+
+    With checkpoint=True the row count, column sums and centered Gram
+    matrix are saved next to the source as <path>.gram.npz, keyed by
+    dataset_fingerprint. Later calls on an unchanged file load them and
+    skip the O(N P^2) pass entirely.
+    """
+    ckpt = path + '.gram.npz'
+    fingerprint = dataset_fingerprint(path) if checkpoint else None
+    if checkpoint and os.path.exists(ckpt):
+        with phase('load', nbytes = os.path.getsize(ckpt)), np.load(ckpt) as saved:
+            if str(saved['fingerprint']) == fingerprint:
+                stats = CovarianceStats(saved['M2'].shape[0])
+                stats.n = int(saved['n'])
+                stats.mean = saved['colsum'] / max(stats.n, 1)
+                stats.M2 = saved['M2']
+                return stats
+
+    D = np.load(path, mmap_mode = 'r')
+    stats = covariance_stats(D, chunk_rows)
+    if checkpoint:
+        # write to a temporary file and rename it so a crash never leaves a
+        # truncated checkpoint behind
+        tmp = ckpt + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, fingerprint = fingerprint, n = stats.n,
+                     colsum = stats.mean * stats.n, M2 = stats.M2)
+        os.replace(tmp, ckpt)
+    return stats
+
+
+def covariance_from_file(path, chunk_rows=4096, ddof=1, standardize=False, checkpoint=True):
+    # covariance() for a .npy file, reusing the Gram checkpoint if valid
+    stats = file_stats(path, chunk_rows, checkpoint)
+    return stats.covariance(ddof, standardize), stats
@@ -0,0 +1,113 @@
+"""
+Incremental SVD: fold new rows of D into an existing decomposition.
+
+Follows the naming of svd_pca_serial: D (N x P) = VT.T * diag(sigma) * U.T,
+i.e. U holds the right singular vectors (eigenvectors of D_T*D) and VT the
+left ones. Appending rows to D appends columns C = new_rows.T to
+D_T = U * diag(sigma) * VT, which is Brand's rank-b update:
+
+    C = U L + J K                      (L = U_T C, J K = QR of the residual)
+    [U sigma VT, C] = [U J] Q [[VT, 0], [0, I]]
+    Q = [[diag(sigma), L], [0, K]]     ((k+r) x (k+b) core)
+
+Only the small core Q is re-diagonalized (by running
+svd_cyclic.cyclic_jacobi on Q Q_T), so an update costs
+O(P (k+b)^2 + (k+b)^3) no matter how many rows have been seen. Tracking
+VT is optional because it is N columns wide.
+"""
+
+import numpy as np
+
+from svd_cyclic import cyclic_jacobi, svd_pca_cyclic
+
+
+class IncrementalSVD:
+    """
+    Rank-k SVD of a row stream. n_components caps the rank kept after each
+    update (None keeps up to P); compute_vt=True also maintains VT, at an
+    extra O(k N) per update.
+    """
+
+    def __init__(self, n_components=None, compute_vt=False):
+        self.n_components = n_components
+        self.compute_vt = compute_vt
+
+    def fit(self, D):
+        D = np.atleast_2d(np.asarray(D, dtype = np.float32))
+        N, P = D.shape
+        sigma, U, VT, _ = svd_pca_cyclic(N, P, D, full_matrices = False)
+        k = P if self.n_components is None else min(self.n_components, P)
+        self.sigma = sigma[:k]
+        self.U = U[:, :k]
+        self.VT = VT[:k] if self.compute_vt else None
+        self.n_samples_seen_ = N
+        return self
+
+    def update(self, new_rows):
+        if not hasattr(self, 'U'):
+            return self.fit(new_rows)
+        # a single row may come as a 1-D array
+        C = np.atleast_2d(np.asarray(new_rows, dtype = np.float32)).T
+        P, b = C.shape
+        k = self.U.shape[1]
+
+        # split the new columns into their part in span(U) and a residual;
+        # a second projection pass keeps J orthogonal to U in float32
+        L = np.dot(self.U.T, C)
+        H = C - np.dot(self.U, L)
+        L2 = np.dot(self.U.T, H)
+        L += L2
+        H -= np.dot(self.U, L2)
+        J, K = np.linalg.qr(H)
+        # drop residual directions that are numerically zero; U and J can
+        # span at most P dimensions (none are left once k == P)
+        keep = np.abs(np.diag(K)) > P * np.finfo(np.float32).eps * max(np.abs(C).max(), 1.0)
+        keep &= np.cumsum(keep) <= P - k
+        J, K = J[:, keep], K[keep]
+        r = J.shape[1]
+
+        Q = np.zeros((k + r, k + b), dtype = np.float32)
+        Q[:k, :k] = np.diag(self.sigma)
+        Q[:k, k:] = L
+        Q[k:, k:] = K
+
+        # re-diagonalize the core: Q Q_T = Uq diag(sigma'^2) Uq_T
+        e, Uq, _ = cyclic_jacobi(np.dot(Q, Q.T))
+        order = np.argsort(e)[::-1]
+        kmax = k + r if self.n_components is None else min(self.n_components, k + r)
+        order = order[:kmax]
+        Uq = Uq[:, order]
+        sigma = np.sqrt(np.clip(e[order], 0, None))
+
+        if self.compute_vt:
+            # VT' = inv(sigma') Uq_T Q [[VT, 0], [0, I]]
+            inv_sigma = np.zeros_like(sigma)
+            inv_sigma[sigma > 0] = 1.0 / sigma[sigma > 0]
+            Vq_T = inv_sigma[:, None] * np.dot(Uq.T, Q)
+            self.VT = np.hstack([np.dot(Vq_T[:, :k], self.VT), Vq_T[:, k:]])
+
+        self.U = np.dot(np.hstack([self.U, J]), Uq)
+        self.sigma = sigma
+        self.n_samples_seen_ += b
+        return self
+
+
+if __name__ == '__main__':
+    # compare the streamed decomposition against a from-scratch one
+    np.random.seed(1)
+    N, P, batch = 400, 12, 25
+    D = np.dot(np.random.randn(N, 6), np.random.randn(6, P)).astype(np.float32)
+    D += 0.01 * np.random.randn(N, P).astype(np.float32)
+
+    inc = IncrementalSVD(compute_vt = True).fit(D[:batch])
+    for start in range(batch, N, batch):
+        inc.update(D[start:start + batch])
+    s, u, vt, _ = svd_pca_cyclic(N, P, D.copy(), full_matrices = False)
+
+    rel_sigma = np.abs(inc.sigma - s[:len(inc.sigma)]).max() / s[0]
+    # compare subspaces rather than vectors to be insensitive to signs
+    proj = np.abs(np.dot(inc.U[:, :6].T, u[:, :6]))
+    recon = np.dot(inc.VT.T * inc.sigma, inc.U.T)
+    print("sigma relative error:", rel_sigma)
+    print("leading subspace |cos| min:", proj.max(axis = 1).min())
+    print("reconstruction error:", np.abs(recon - D).max() / np.abs(D).max())
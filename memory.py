@@ -0,0 +1,138 @@
+"""
+Memory footprint model and the memory_budget= option of the drivers.
+
+host_footprint() and device_footprint() give the working bytes of
+svd_pca_serial / cudaSVD per phase (covariance, sweep, sort/permute, V_T,
+with the zero padded N x N VT of full_matrices=True under V_T), not
+counting D itself. plan() turns a budget into settings before any work starts:
+
+  * the N x N VT padding is dropped (full_matrices=False) when it alone
+    breaks the budget,
+  * the row tiles of compact / sparse D in the Gram and projection stages
+    are shrunk (tile_rows, down to 64 rows),
+
+and raises MemoryError with the per-phase estimate when even that does
+not fit. The device budget is the same number, capped by the free device
+memory when a CUDA context is available.
+
+Measured bytes come from profiling.profiled(memory=True), which records
+the live and peak traced host bytes of every phase (tracemalloc sees
+NumPy's buffers); the GPU path records its device_footprint() estimate
+per phase as device_bytes.
+"""
+
+import numpy as np
+
+
+MIN_TILE_ROWS = 64
+
+
+def host_footprint(N, P, itemsize=4, full_matrices=True, tiled=False, tile_rows=4096, device=False):
+    # phase -> bytes of the host arrays alive at the peak of the phase. A is
+    # the P x P covariance, E the eigenvectors; tiled D is upcast tile by
+    # tile (float64 tiles in the Gram stage, itemsize tiles in the
+    # projection). device=True adds the host copy of D_T that cudaSVD
+    # keeps for the V_T stage
+    PP = P * P * itemsize
+    NP = N * P * itemsize
+    tile = min(tile_rows, N) * P if tiled else 0
+    phases = {
+        # float64 accumulator and tile product next to the tile itself
+        'covariance': (2 * P * P * 8 + tile * 8) if tiled else PP,
+        # A, E and the O(P) state of the serial solver
+        'sweep': 2 * PP + 16 * P,
+        # A, E and the permuted copy U
+        'sort/permute': 3 * PP,
+        # E, U and VT (scaled in place) next to a projection tile, then VT
+        # next to its N x N padded copy
+        'V_T': 2 * PP + NP + max(tile * itemsize, N * N * itemsize if full_matrices else 0),
+    }
+    if device and not tiled:
+        phases = dict((name, nbytes + NP) for name, nbytes in phases.items())
+    return phases
+
+
+def device_footprint(N, P, tiled=False):
+    # phase -> float32 device bytes of cudaSVD. gpuMul and cuda_Transpose
+    # keep their last operands alive, and computeParams / dimUpdate each
+    # hold A, sin, cos and a schedule (dimUpdate also X and the
+    # eigenvectors). Tiled (compact / sparse) D stays on the host
+    if tiled:
+        return {'sweep': 12 * P * P * 4}
+    return {'load': 2 * N * P * 4,
+            'covariance': (3 * N * P + P * P) * 4,
+            'sweep': (3 * N * P + 12 * P * P) * 4,
+            'V_T': (4 * N * P + 3 * P * P) * 4}
+
+
+def _free_device_bytes():
+    # free device memory, or None without a usable CUDA context
+    try:
+        import pycuda.autoinit
+        import pycuda.driver as cuda
+        return cuda.mem_get_info()[0]
+    except Exception:
+        return None
+
+
+def _describe(phases):
+    return ', '.join("%s %.1f MiB" % (name, nbytes / 2.0**20) for name, nbytes in phases.items())
+
+
+def plan(N, P, budget, itemsize=4, full_matrices=True, tiled=False, tile_rows=4096, device=False):
+    """
+    Settings that keep the estimated peak within budget bytes: a dict with
+    full_matrices, tile_rows, host_peak and device_peak (bytes, 0 without
+    device) and the per-phase estimates host / device. Raises MemoryError
+    with the estimate if no setting fits.
+    """
+    if budget is None or budget <= 0:
+        raise ValueError("memory_budget must be a positive number of bytes, got %r" % (budget,))
+    host = host_footprint(N, P, itemsize, full_matrices, tiled, tile_rows, device)
+    if full_matrices and max(host.values()) > budget:
+        full_matrices = False
+        host = host_footprint(N, P, itemsize, False, tiled, tile_rows, device)
+    while tiled and max(host.values()) > budget and tile_rows > MIN_TILE_ROWS:
+        tile_rows = max(tile_rows // 2, MIN_TILE_ROWS)
+        host = host_footprint(N, P, itemsize, False, tiled, tile_rows, device)
+    if max(host.values()) > budget:
+        raise MemoryError("N=%d, P=%d needs %.1f MiB of host memory (%s), memory_budget is %.1f MiB"
+                          % (N, P, max(host.values()) / 2.0**20, _describe(host), budget / 2.0**20))
+
+    dev, device_peak = {}, 0
+    if device:
+        dev = device_footprint(N, P, tiled)
+        device_peak = max(dev.values())
+        limit = budget
+        free = _free_device_bytes()
+        if free is not None:
+            limit = min(limit, free)
+        if device_peak > limit:
+            raise MemoryError("N=%d, P=%d needs %.1f MiB of device memory (%s), limit is %.1f MiB"
+                              % (N, P, device_peak / 2.0**20, _describe(dev), limit / 2.0**20))
+    return {'full_matrices': full_matrices, 'tile_rows': tile_rows,
+            'host_peak': max(host.values()), 'device_peak': device_peak,
+            'host': host, 'device': dev}
+
+
+if __name__ == '__main__':
+    # estimated against measured peak host bytes of svd_pca_serial, and the
+    # settings chosen for a shrinking budget
+    from profiling import profiled
+    from v1 import svd_pca_serial
+    np.random.seed(1)
+    print("N     P    full   estimate(KiB)  measured(KiB)")
+    for N, P, full in ((200, 16, True), (200, 16, False), (2000, 24, False)):
+        D = np.random.randn(N, P).astype(np.float32)
+        with profiled(memory = True) as prof:
+            svd_pca_serial(N, P, D, full_matrices = full)
+        measured = max(r['counts'].get('peak_bytes', 0) for r in prof.phases.values())
+        print("%-5d %-4d %-6s %-14.1f %.1f" % (N, P, full, max(host_footprint(N, P, 4, full).values()) / 1024.0, measured / 1024.0))
+    print("\nbudget(MiB)  full_matrices  tile_rows  host peak(MiB)")
+    N, P = 20000, 128
+    for budget in (2048, 64, 11, 8):
+        try:
+            p = plan(N, P, budget * 2**20, tiled = True)
+            print("%-12g %-14s %-10d %.1f" % (budget, p['full_matrices'], p['tile_rows'], p['host_peak'] / 2.0**20))
+        except MemoryError as err:
+            print("%-12g %s" % (budget, err))
@@ -0,0 +1,104 @@
+"""
+Mixed-precision Jacobi: float32 sweeps with a float64 refinement.
+
+The bulk of the sweeps run in float32 (host cyclic, serial or CUDA
+solver), which converges to about 1e-6 relative. The float32 eigenvectors
+U are then promoted, re-orthogonalized to float64 precision with
+Newton-Schulz steps and used to warm start svd_cyclic.cyclic_jacobi on
+U_T A U in float64. That matrix is diagonal up to float32 round-off and
+Jacobi converges quadratically from there, so one or two float64 sweeps
+recover float64 accuracy for a fraction of a full float64 solve.
+"""
+
+import time
+
+import numpy as np
+
+from Helper import s_driver
+from compact import gram
+from svd_cyclic import cyclic_jacobi
+
+
+def orthonormalize(U, max_steps=3):
+    # Newton-Schulz iteration U <- U (3I - U_T U) / 2 towards the nearest
+    # orthogonal matrix; each step squares the orthogonality error, so a
+    # float32 basis reaches float64 precision in two steps
+    U = np.array(U, dtype = np.float64)
+    I = np.eye(U.shape[1])
+    for _ in range(max_steps):
+        G = np.dot(U.T, U) - I
+        if np.abs(G).max() <= U.shape[1] * np.finfo(np.float64).eps:
+            break
+        U = U - 0.5 * np.dot(U, G)
+    return U
+
+
+def refine(A, U, max_sweeps=2):
+    # float64 eigenpairs of the symmetric A from an approximate (float32)
+    # eigenbasis U; returns e, E and the float64 sweeps applied
+    U = orthonormalize(U)
+    return cyclic_jacobi(np.asarray(A, dtype = np.float64), warm_start = U, max_sweeps = max_sweeps)
+
+
+def mixed_jacobi(A, solver='cyclic', bulk_tol=None, refine_sweeps=2, stats=None):
+    """
+    Eigen-decomposition of the symmetric matrix A: float32 sweeps with
+    `solver` ('cyclic', 'serial' or 'cuda'), then up to refine_sweeps
+    float64 sweeps from the float32 eigenbasis. bulk_tol is the
+    cyclic_jacobi threshold of the float32 stage (solver='cyclic' only).
+    If a dict is passed as stats, the time and sweeps (rotations for
+    'serial') of both stages are stored in it.
+
+    Returns float64 eigenvalues e, eigenvectors E (as columns, unsorted)
+    and the number of float64 sweeps.
+    """
+    t0 = time.time()
+    A32 = np.array(A, dtype = np.float32)
+    if solver == 'cyclic':
+        e, U, bulk = cyclic_jacobi(A32, tol = bulk_tol)
+    elif solver == 'serial':
+        from v1 import jacobi_serial
+        e, U, bulk = jacobi_serial(A32)
+    elif solver == 'cuda':
+        from svd_cuda import cudaJacobi
+        _, U = cudaJacobi(A32)
+        bulk = None
+    else:
+        raise ValueError("unknown solver %r" % (solver,))
+    t1 = time.time()
+    e, E, sweeps = refine(A, U, refine_sweeps)
+    if stats is not None:
+        stats.update(bulk_time = t1 - t0, refine_time = time.time() - t1,
+                     bulk_sweeps = bulk, refine_sweeps = sweeps)
+    return e, E, sweeps
+
+
+def svd_pca_mixed(N, P, D, full_matrices=True, **options):
+    # Helper.s_driver with mixed_jacobi, in float64; the Gram matrix is
+    # accumulated in float64 so the refinement has an accurate target.
+    # options go to mixed_jacobi
+    covariance = lambda D: gram(D, dtype = np.float64)
+    return s_driver(mixed_jacobi, D, full_matrices, covariance = covariance, **options)
+
+
+if __name__ == '__main__':
+    # accuracy / time trade-off against full float32 and full float64
+    # cyclic Jacobi; errors are relative to the largest eigenvalue
+    np.random.seed(1)
+    print("P     mode     time(s)  eig. err  residual  orthogonality")
+    for P in (128, 256):
+        X = np.random.randn(2 * P, P)
+        C = np.dot(X.T, X)
+        ref = np.linalg.eigvalsh(C)
+        runs = [('float32', lambda: cyclic_jacobi(C.astype(np.float32))),
+                ('float64', lambda: cyclic_jacobi(C)),
+                ('mixed', lambda: mixed_jacobi(C))]
+        for mode, run in runs:
+            t0 = time.time()
+            e, E, _ = run()
+            t = time.time() - t0
+            e, E = e.astype(np.float64), E.astype(np.float64)
+            err = np.abs(np.sort(e) - ref).max() / ref.max()
+            res = np.abs(np.dot(C, E) - E * e).max() / ref.max()
+            orth = np.abs(np.dot(E.T, E) - np.eye(P)).max()
+            print("%-5d %-8s %-8.3f %-9.1e %-9.1e %.1e" % (P, mode, t, err, res, orth))
@@ -0,0 +1,209 @@
+"""
+Packed symmetric storage for the covariance matrix.
+
+Two-sided rotations keep A symmetric, so only its upper triangle is
+stored: P(P+1)/2 entries in row order, A[i, j] (i <= j) at
+off[i] + j - i with off[i] = i P - i (i - 1) / 2. That halves the largest
+working array of the solvers (the eigenvectors stay dense, they are part
+of the result), so P can grow by about 1.4x in the same memory.
+
+Rotations update the packed rows and columns in place. A round of
+disjoint pairs touches every entry as part of a 2 x 2 block
+{k, l} x {j, m} of two pairs, and each block depends only on its own four
+entries, so blocks are gathered, rotated on both sides and scattered back
+in chunks without a dense temporary.
+"""
+
+import time
+
+import numpy as np
+
+from Helper import s_driver
+from compact import compact_format, upcast
+from sparse_input import is_sparse
+from svd_cyclic import chess_schedule, jacobi_params
+
+
+def packed_offsets(P):
+    # position of the diagonal entry A[i, i] for every row i
+    i = np.arange(P, dtype = np.int64)
+    return i * P - i * (i - 1) // 2
+
+
+def packed_index(off, i, j):
+    # packed position of A[i, j] for either triangle (vectorized)
+    lo, hi = np.minimum(i, j), np.maximum(i, j)
+    return off[lo] + hi - lo
+
+
+def pack(A):
+    P = A.shape[0]
+    return A[np.triu_indices(P)]
+
+
+def unpack(Ap, P):
+    iu = np.triu_indices(P)
+    A = np.zeros((P, P), dtype = Ap.dtype)
+    A[iu] = Ap
+    A.T[iu] = Ap
+    return A
+
+
+def packed_gram(D, block=256, dtype=None, tile_rows=4096):
+    # upper triangle of D_T D, computed one block of rows at a time so only
+    # a block x P slab is ever materialized next to the packed result.
+    # Compact, integer and scipy.sparse D are accumulated in float64 tile by
+    # tile, like compact.gram, and returned in dtype (float32 by default)
+    N, P = D.shape
+    direct = not is_sparse(D) and compact_format(D) is None and D.dtype.kind in 'fc'
+    if dtype is None:
+        dtype = np.result_type(D.dtype, np.float32) if direct else np.float32
+    off = packed_offsets(P)
+    Ap = np.empty(P * (P + 1) // 2, dtype = dtype)
+    for r0 in range(0, P, block):
+        r1 = min(r0 + block, P)
+        if direct:
+            G = np.dot(D[:, r0:r1].T, D[:, r0:])
+        else:
+            G = np.zeros((r1 - r0, P - r0))
+            for start in range(0, N, tile_rows):
+                if is_sparse(D):
+                    X = D[start:start + tile_rows].tocsr().astype(np.float64)[:, r0:]
+                    G += (X[:, :r1 - r0].T @ X).toarray()
+                else:
+                    X = upcast(D[start:start + tile_rows, r0:], np.float64)
+                    G += np.dot(X[:, :r1 - r0].T, X)
+        for i in range(r0, r1):
+            Ap[off[i]:off[i] + P - i] = G[i - r0, i - r0:]
+    return Ap
+
+
+def packed_rotate(Ap, off, k, l, c, s):
+    # single two-sided rotation J_T A J of the (k, l) plane: one row update
+    # of rows k and l for every other column, then the 2 x 2 diagonal block
+    P = len(off)
+    j = np.arange(P)
+    j = j[(j != k) & (j != l)]
+    pk, pl = packed_index(off, k, j), packed_index(off, l, j)
+    ak, al = Ap[pk], Ap[pl]
+    Ap[pk] = c * ak - s * al
+    Ap[pl] = s * ak + c * al
+    akk, akl, all_ = Ap[off[k]], Ap[packed_index(off, k, l)], Ap[off[l]]
+    bkk, bkl = c * akk - s * akl, c * akl - s * all_
+    blk, bll = s * akk + c * akl, s * akl + c * all_
+    Ap[off[k]] = c * bkk - s * bkl
+    Ap[packed_index(off, k, l)] = s * bkk + c * bkl
+    Ap[off[l]] = s * blk + c * bll
+
+
+def packed_round(Ap, off, k, l, c, s, active=None, chunk=1 << 16):
+    # apply the disjoint rotations (k[i], l[i], c[i], s[i]) of one round. An
+    # index left out of every pair (odd P) joins as the identity pair (u, u).
+    # Pairs with active[i] False are treated as the identity, and blocks
+    # between two of them are skipped.
+    P = len(off)
+    idle = np.setdiff1d(np.arange(P), np.concatenate([k, l]))
+    if active is None:
+        active = np.ones(len(k), dtype = bool)
+    k, l = np.concatenate([k, idle]), np.concatenate([l, idle])
+    active = np.concatenate([active, np.zeros(len(idle), dtype = bool)])
+    c = np.where(active, np.resize(c, len(k)), 1).astype(c.dtype)
+    s = np.where(active, np.resize(s, len(k)), 0).astype(s.dtype)
+    n = len(k)
+
+    # off-diagonal blocks {k_p, l_p} x {k_q, l_q}, p < q, in row chunks
+    rows = max(chunk // max(n, 1), 1)
+    for p0 in range(0, n, rows):
+        p, q = np.nonzero(np.arange(p0, min(p0 + rows, n))[:, None] < np.arange(n)[None, :])
+        p += p0
+        keep = active[p] | active[q]
+        p, q = p[keep], q[keep]
+        if len(p) == 0:
+            continue
+        kp, lp, jq, mq = k[p], l[p], k[q], l[q]
+        idx = [packed_index(off, kp, jq), packed_index(off, kp, mq),
+               packed_index(off, lp, jq), packed_index(off, lp, mq)]
+        akj, akm, alj, alm = (Ap[i] for i in idx)
+        cp, sp, cq, sq = c[p], s[p], c[q], s[q]
+        # row update with (c_p, s_p), then column update with (c_q, s_q)
+        bkj, bkm = cp * akj - sp * alj, cp * akm - sp * alm
+        blj, blm = sp * akj + cp * alj, sp * akm + cp * alm
+        Ap[idx[0]] = cq * bkj - sq * bkm
+        Ap[idx[1]] = sq * bkj + cq * bkm
+        Ap[idx[2]] = cq * blj - sq * blm
+        Ap[idx[3]] = sq * blj + cq * blm
+
+    # diagonal blocks of the active pairs
+    a = np.flatnonzero(active)
+    ka, la, ca, sa = k[a], l[a], c[a], s[a]
+    pkl = packed_index(off, ka, la)
+    akk, akl, all_ = Ap[off[ka]], Ap[pkl], Ap[off[la]]
+    bkk, bkl = ca * akk - sa * akl, ca * akl - sa * all_
+    blk, bll = sa * akk + ca * akl, sa * akl + ca * all_
+    Ap[off[ka]] = ca * bkk - sa * bkl
+    Ap[pkl] = sa * bkk + ca * bkl
+    Ap[off[la]] = sa * blk + ca * bll
+
+
+def packed_jacobi(Ap, P, tol=None, max_sweeps=30):
+    """
+    Cyclic Jacobi (chess ordering, same threshold as svd_cyclic.cyclic_jacobi)
+    on a matrix in packed upper-triangular storage. Ap is rotated in place.
+
+    Returns eigenvalues e, eigenvectors E (as dense columns, unsorted) and
+    the number of sweeps that applied at least one rotation.
+    """
+    dtype = Ap.dtype
+    if tol is None:
+        tol = np.finfo(dtype).eps
+    off = packed_offsets(P)
+    E = np.eye(P, dtype = dtype)
+    schedule = chess_schedule(P)
+    sweeps = 0
+    while sweeps < max_sweeps:
+        rotated = False
+        for pairs in schedule:
+            k, l = pairs[:, 0], pairs[:, 1]
+            akk, all_, akl = Ap[off[k]], Ap[off[l]], Ap[packed_index(off, k, l)]
+            active = np.abs(akl) > tol * np.sqrt(np.abs(akk * all_))
+            if not active.any():
+                continue
+            c, s = jacobi_params(akk, all_, akl)
+            packed_round(Ap, off, k, l, c, s, active)
+            ka, la, ca, sa = k[active], l[active], c[active], s[active]
+            Ek, El = E[:, ka], E[:, la]
+            E[:, ka] = Ek * ca - El * sa
+            E[:, la] = Ek * sa + El * ca
+            rotated = True
+        if not rotated:
+            break
+        sweeps += 1
+
+    return Ap[off].copy(), E, sweeps
+
+
+def svd_pca_packed(N, P, D, full_matrices=True, **options):
+    # Helper.s_driver with D_T D formed and solved in packed storage;
+    # options go to packed_jacobi
+    solve = lambda Ap, **options: packed_jacobi(Ap, P, **options)
+    return s_driver(solve, D, full_matrices, covariance = packed_gram, **options)
+
+
+if __name__ == '__main__':
+    # packed against dense cyclic Jacobi: time, accuracy and the bytes of
+    # the covariance working array
+    from svd_cyclic import cyclic_jacobi
+    np.random.seed(1)
+    print("P     dense(s)  packed(s)  dense MiB  packed MiB  rel. err")
+    for P in (64, 128, 256):
+        D = np.random.randn(2 * P, P).astype(np.float32)
+        C = np.dot(D.T, D)
+        t0 = time.time()
+        cyclic_jacobi(C)
+        t1 = time.time()
+        Ap = packed_gram(D)
+        nbytes = Ap.nbytes
+        e, E, sweeps = packed_jacobi(Ap, P)
+        t2 = time.time()
+        err = np.abs(np.sort(e) - np.linalg.eigvalsh(C.astype(np.float64))).max() / e.max()
+        print("%-5d %-9.3f %-10.3f %-10.2f %-11.2f %.1e" % (P, t1 - t0, t2 - t1, C.nbytes / 2**20, nbytes / 2**20, err))
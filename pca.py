@@ -0,0 +1,181 @@
+"""
+PCA estimator built on the Jacobi eigensolvers.
+
+JacobiPCA accumulates the mean and centered scatter matrix of the data
+(see covariance.py), hands the P x P covariance matrix to the host cyclic
+(svd_cyclic.cyclic_jacobi, the default), serial (v1.jacobi_serial), mixed
+precision (mixed.mixed_jacobi) or CUDA (svd_cuda.cudaJacobi) solver and
+projects data onto the leading eigenvectors. The solve is deferred until
+a fitted attribute is read, so a stream of partial_fit calls only pays
+for the eigen-decompositions whose results are used, and each one
+warm-starts from the previous eigenbasis.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from compact import compact_format, upcast
+from covariance import CovarianceStats, covariance_stats, file_stats
+from sparse_input import is_sparse
+from svd_cyclic import cyclic_jacobi
+from v1 import jacobi_serial
+
+
+def _eig(C, solver, warm_start=None):
+    # eigenpairs of the symmetric matrix C, sorted by descending eigenvalue;
+    # warm_start (a previous eigenbasis) is ignored by the mixed solver
+    if solver == 'serial':
+        e, E, _ = jacobi_serial(C.astype(np.float32), warm_start = warm_start)
+    elif solver == 'cyclic':
+        e, E, _ = cyclic_jacobi(C, warm_start = warm_start)
+    elif solver == 'mixed':
+        from mixed import mixed_jacobi
+        e, E, _ = mixed_jacobi(C)
+    elif solver == 'cuda':
+        from svd_cuda import cudaJacobi
+        A, E = cudaJacobi(np.ascontiguousarray(C, dtype = np.float32), warm_start = warm_start)
+        e = np.diag(A)
+    else:
+        raise ValueError("unknown solver %r" % (solver,))
+    order = np.argsort(e)[::-1]
+    return np.clip(e[order], 0, None), E[:, order]
+
+
+def _fitted(name):
+    # read-only attribute that runs the deferred solve first
+    return property(lambda self: self._results()[name])
+
+
+class JacobiPCA:
+    """
+    Principal component analysis via Jacobi diagonalization of the
+    covariance matrix.
+
+    n_components is the number of components to keep: an int, a float in
+    (0, 1) selecting the smallest number of components explaining that
+    fraction of the variance, or None to keep all P. chunk_size bounds the
+    number of rows reduced or projected at once by partial_fit, transform
+    and inverse_transform, and n_jobs > 1 projects chunks on a thread pool.
+    solver is 'cyclic', 'serial' (the classical Python loop, slow beyond
+    small P), 'mixed' or 'cuda'.
+    """
+
+    n_components_ = _fitted('n_components_')
+    components_ = _fitted('components_')
+    explained_variance_ = _fitted('explained_variance_')
+    explained_variance_ratio_ = _fitted('explained_variance_ratio_')
+    singular_values_ = _fitted('singular_values_')
+
+    def __init__(self, n_components=None, solver='cyclic', chunk_size=4096, n_jobs=1):
+        self.n_components = n_components
+        self.solver = solver
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def fit(self, D):
+        self.n_samples_seen_ = 0
+        return self.partial_fit(D)
+
+    def partial_fit(self, D):
+        # D may be a scipy.sparse matrix; it is reduced without densifying
+        if not is_sparse(D):
+            D = np.asarray(D)
+        if D.ndim != 2:
+            raise ValueError("expected a 2-D array, got shape %r" % (D.shape,))
+        N, P = D.shape
+        if getattr(self, 'n_samples_seen_', 0) == 0:
+            self.n_features_ = P
+            self._stats = CovarianceStats(P)
+            self._basis = None
+        elif P != self.n_features_:
+            raise ValueError("expected %d features, got %d" % (self.n_features_, P))
+
+        # fold the batch into the running mean and centered scatter matrix
+        self._stats.merge(covariance_stats(D, self.chunk_size))
+        return self._refit()
+
+    def fit_file(self, path, checkpoint=True):
+        # fit on a .npy file; with checkpoint=True the reduced statistics are
+        # kept next to it (covariance.file_stats), so refits with other
+        # solver settings go straight to the eigensolver
+        self._stats = file_stats(path, self.chunk_size, checkpoint)
+        self.n_features_ = self._stats.M2.shape[0]
+        self._basis = None
+        return self._refit()
+
+    def _refit(self):
+        # the statistics changed; the solve waits until a result is read
+        self.n_samples_seen_ = self._stats.n
+        self.mean_ = self._stats.mean
+        self._fit_results = None
+        return self
+
+    def _results(self):
+        if getattr(self, '_fit_results', None) is None:
+            if not hasattr(self, '_stats'):
+                raise AttributeError("JacobiPCA is not fitted yet")
+            self._fit_results = self._solve(self._stats.covariance())
+        return self._fit_results
+
+    def _solve(self, C):
+        e, E = _eig(C, self.solver, self._basis)
+        self._basis = E
+        total = e.sum()
+        ratio = e / total if total > 0 else np.zeros_like(e)
+
+        k = self.n_components
+        if k is None:
+            k = len(e)
+        elif isinstance(k, float) and 0 < k < 1:
+            k = int(np.searchsorted(np.cumsum(ratio), k) + 1)
+        k = min(int(k), len(e))
+
+        return {'n_components_': k,
+                'components_': np.ascontiguousarray(E[:, :k].T),
+                'explained_variance_': e[:k],
+                'explained_variance_ratio_': ratio[:k],
+                'singular_values_': np.sqrt(e[:k] * max(self.n_samples_seen_ - 1, 1))}
+
+    def _chunked(self, X, W, offset, n_out):
+        # out = X W - offset, one chunk of rows at a time. Subtracting the
+        # projected offset fuses centering into the product so no centered
+        # copy of X is ever made.
+        N = X.shape[0]
+        if compact_format(X) is None:
+            dtype = np.result_type(X.dtype, W.dtype)
+        else:
+            dtype = np.result_type(W.dtype, np.float32)
+        out = np.empty((N, n_out), dtype = dtype)
+        W = W.astype(dtype, copy = False)
+        offset = offset.astype(dtype, copy = False)
+
+        def project(start):
+            stop = min(start + self.chunk_size, N)
+            if is_sparse(X):
+                out[start:stop] = X[start:stop] @ W
+            else:
+                np.dot(upcast(X[start:stop], dtype), W, out = out[start:stop])
+            out[start:stop] -= offset
+
+        starts = range(0, N, self.chunk_size)
+        if self.n_jobs is not None and self.n_jobs > 1 and N > self.chunk_size:
+            with ThreadPoolExecutor(max_workers = self.n_jobs) as pool:
+                list(pool.map(project, starts))
+        else:
+            for start in starts:
+                project(start)
+        return out
+
+    def transform(self, X):
+        if not is_sparse(X):
+            X = np.asarray(X)
+        W = self.components_.T
+        return self._chunked(X, W, np.dot(self.mean_, W), self.n_components_)
+
+    def inverse_transform(self, Z):
+        Z = np.asarray(Z)
+        return self._chunked(Z, self.components_, -self.mean_, self.n_features_)
+
+    def fit_transform(self, D):
+        return self.fit(D).transform(D)
@@ -0,0 +1,178 @@
+"""
+Per-phase instrumentation of the solvers.
+
+    with profiled() as prof:
+        svd_pca_cyclic(N, P, D)
+    print(prof.summary())
+
+While a Profile is active the drivers record named phases: load,
+covariance, schedule, sweep (one record per sweep), sort/permute and V_T.
+Each phase collects wall time, calls, counters (rotations applied /
+skipped, kernel launches, h2d_bytes / d2h_bytes on the GPU path) and
+estimated flops and bytes moved (model counts for the dense kernels,
+not hardware counters). callback(name, seconds, record) is called after
+every phase, e.g. to stream sweeps to a log. profiled(memory=True) also
+records the live and peak host bytes of every phase (tracemalloc, so
+only allocations made inside the block count, and everything runs
+slower); device_bytes on the GPU path is the memory.device_footprint()
+estimate of the phase.
+
+With no active Profile, phase() returns a shared no-op context manager.
+The sweep-based solvers look up current() once per solve and test it once
+per sweep, never inside the rotation loops. v1.jacobi_serial has no
+sweeps (its 'sweep' records cover P(P-1)/2 rotations), so it tests the
+cached `prof is not None` after every rotation, next to the O(P) Python
+loops of the rotation itself. Either way disabled profiling costs
+nothing measurable.
+"""
+
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from sparse_input import is_sparse
+
+
+_active = None
+_NULL = nullcontext()
+# counters that keep their largest value instead of a sum
+_PEAKS = ('peak_bytes', 'device_bytes')
+
+
+class _Phase:
+    # context manager timing one phase into a Profile
+    __slots__ = ('profile', 'name', 'flops', 'nbytes', 'counts', 't0')
+
+    def __init__(self, profile, name, flops, nbytes, counts):
+        self.profile, self.name, self.flops, self.nbytes, self.counts = profile, name, flops, nbytes, counts
+
+    def __enter__(self):
+        if self.profile.memory:
+            tracemalloc.reset_peak()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, time.perf_counter() - self.t0, self.flops, self.nbytes, **self.counts)
+        return False
+
+
+class Profile:
+    """
+    Phase records in the order first seen: name -> dict with calls, time
+    (seconds), flops, bytes and counts (name -> total; the largest value
+    for peak_bytes and device_bytes, the last one for live_bytes).
+    """
+
+    def __init__(self, callback=None, memory=False):
+        self.callback = callback
+        self.memory = memory
+        self.phases = OrderedDict()
+
+    def add(self, name, seconds, flops=0, nbytes=0, **counts):
+        record = self.phases.get(name)
+        if record is None:
+            record = self.phases[name] = {'calls': 0, 'time': 0.0, 'flops': 0.0, 'bytes': 0.0, 'counts': {}}
+        record['calls'] += 1
+        record['time'] += seconds
+        record['flops'] += flops
+        record['bytes'] += nbytes
+        if self.memory:
+            # peak since the phase (or the previous record) started
+            counts['live_bytes'], counts['peak_bytes'] = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        totals = record['counts']
+        for key, value in counts.items():
+            if key in _PEAKS:
+                totals[key] = max(totals.get(key, 0), value)
+            elif key == 'live_bytes':
+                totals[key] = value
+            else:
+                totals[key] = totals.get(key, 0) + value
+        if self.callback is not None:
+            self.callback(name, seconds, record)
+
+    def phase(self, name, flops=0, nbytes=0, **counts):
+        return _Phase(self, name, flops, nbytes, counts)
+
+    def total(self):
+        return sum(record['time'] for record in self.phases.values())
+
+    def summary(self):
+        # one row per phase: time, share, calls, GFLOP/s and GB/s from the
+        # estimates, then the counters
+        total = max(self.total(), 1e-12)
+        lines = ["phase          time(s)   share  calls  GFLOP/s  GB/s    counts"]
+        for name, r in self.phases.items():
+            t = max(r['time'], 1e-12)
+            counts = ' '.join("%s=%d" % item for item in sorted(r['counts'].items()))
+            lines.append("%-14s %-9.4f %-6.1f %-6d %-8.2f %-7.2f %s" % (
+                name, r['time'], 100 * r['time'] / total, r['calls'],
+                r['flops'] / t / 1e9, r['bytes'] / t / 1e9, counts))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profiled(callback=None, memory=False):
+    # make a fresh Profile active for the block; nested blocks each get
+    # their own and restore the outer one on exit
+    global _active
+    outer, _active = _active, Profile(callback, memory)
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield _active
+    finally:
+        _active = outer
+        if started:
+            tracemalloc.stop()
+
+
+def current():
+    # the active Profile, or None when profiling is off
+    return _active
+
+
+def phase(name, flops=0, nbytes=0, **counts):
+    # time a phase into the active Profile; a shared no-op when off
+    if _active is None:
+        return _NULL
+    return _Phase(_active, name, flops, nbytes, counts)
+
+
+def data_bytes(D):
+    # bytes held by D, dense or scipy.sparse (values and index arrays)
+    if is_sparse(D):
+        D = D.tocsr()
+        return D.data.nbytes + D.indices.nbytes + D.indptr.nbytes
+    return D.nbytes
+
+
+if __name__ == '__main__':
+    # phase breakdown of the host drivers, and the cost of the disabled
+    # hooks against the same run. The solvers see the imported module, not
+    # this __main__ copy
+    import numpy as np
+    from profiling import profiled
+    from svd_cyclic import svd_pca_cyclic
+    from v1 import svd_pca_serial
+    np.random.seed(1)
+    D = np.random.randn(2048, 128).astype(np.float32)
+    with profiled() as prof:
+        svd_pca_cyclic(2048, 128, D, full_matrices = False)
+    print("svd_pca_cyclic, N=2048, P=128\n" + prof.summary() + "\n")
+    with profiled() as prof:
+        svd_pca_serial(256, 24, D[:256, :24], full_matrices = False)
+    print("svd_pca_serial, N=256, P=24\n" + prof.summary() + "\n")
+    times = {}
+    for mode in ('off', 'on', 'off ', 'on '):
+        t0 = time.perf_counter()
+        if mode.strip() == 'on':
+            with profiled():
+                svd_pca_cyclic(2048, 128, D, full_matrices = False)
+        else:
+            svd_pca_cyclic(2048, 128, D, full_matrices = False)
+        times[mode.strip()] = min(times.get(mode.strip(), np.inf), time.perf_counter() - t0)
+    print("cyclic run, profiling off %.4fs, on %.4fs" % (times['off'], times['on']))
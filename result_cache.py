@@ -0,0 +1,184 @@
+"""
+Content-addressed cache for decomposition results.
+
+Results are keyed by a BLAKE2b hash of the solver, its options and the
+content of D (shape, dtype and bytes; format and index arrays for
+scipy.sparse D; array valued options the same way), so re-decomposing
+an identical matrix (the same feature block across retries or
+grid-search folds) is a lookup. The
+in-memory tier is an LRU bounded by the total bytes of the cached arrays;
+the optional on-disk tier stores every result as .npy files, memory
+maps them on a hit and promotes the hit into the in-memory tier, so a
+repeated hit does not reopen the files.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from sparse_input import is_sparse
+from v1 import svd_pca_serial
+
+
+def _update(h, x):
+    # feed x to the hash: arrays (and scipy.sparse matrices) by type, shape,
+    # dtype and bytes, since the repr of a large array is abbreviated;
+    # tuples, lists and dicts element by element, everything else by repr
+    if is_sparse(x):
+        # CSR / CSC keep their own layout, the other formats go through CSR
+        x = x if x.format in ('csr', 'csc') else x.tocsr()
+        h.update(repr(('sparse', x.format, x.shape)).encode())
+        for part in (x.data, x.indices, x.indptr):
+            _update(h, part)
+    elif isinstance(x, np.ndarray):
+        # the type tells a compact.BFloat16 D from the same uint16 bits
+        h.update(repr(('array', type(x).__name__, x.shape, x.dtype.str)).encode())
+        h.update(memoryview(np.ascontiguousarray(x).reshape(-1).view(np.uint8)))
+    elif isinstance(x, (tuple, list)):
+        h.update(("%s%d(" % (type(x).__name__, len(x))).encode())
+        for item in x:
+            _update(h, item)
+        h.update(b")")
+    elif isinstance(x, dict):
+        _update(h, sorted(x.items(), key = lambda item: repr(item[0])))
+    else:
+        h.update(repr(x).encode())
+
+
+def result_key(D, solver=None, **options):
+    # fast content hash of (solver, options, D); array valued options and
+    # D are hashed by content (type, shape, dtype and bytes), scipy.sparse
+    # D by its format and index arrays
+    h = hashlib.blake2b(digest_size = 20)
+    if solver is not None:
+        h.update(("%s.%s" % (solver.__module__, solver.__qualname__)).encode())
+    _update(h, sorted(options.items()))
+    _update(h, D if is_sparse(D) or isinstance(D, np.ndarray) else np.asarray(D))
+    return h.hexdigest()
+
+
+def _nbytes(result):
+    return sum(np.asarray(x).nbytes for x in result)
+
+
+class ResultCache:
+    """
+    LRU cache of result tuples. max_bytes bounds the total size of the
+    arrays held in memory; disk_dir enables the on-disk tier. Cached arrays
+    are returned read-only since they are shared between hits.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok = True)
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or self._disk_paths(key) is not None
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        paths = self._disk_paths(key)
+        if paths is not None:
+            self.disk_hits += 1
+            return self._insert(key, tuple(self._load(p) for p in paths))
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        result = self._insert(key, tuple(self._freeze(x) for x in result))
+        if self.disk_dir is not None:
+            self._store(key, result)
+        return result
+
+    def _insert(self, key, result):
+        # add result to the in-memory LRU, evicting the least recently used
+        # entries beyond max_bytes; a result larger than max_bytes is not
+        # kept in memory
+        size = _nbytes(result)
+        if key in self._entries:
+            self.nbytes -= _nbytes(self._entries.pop(key))
+        if size <= self.max_bytes:
+            self._entries[key] = result
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last = False)
+                self.nbytes -= _nbytes(evicted)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self.nbytes}
+
+    @staticmethod
+    def _freeze(x):
+        if isinstance(x, np.ndarray):
+            x.setflags(write = False)
+        return x
+
+    @staticmethod
+    def _load(path):
+        # scalars (e.g. timings) are stored as 0-d arrays and unwrapped
+        x = np.load(path, mmap_mode = 'r')
+        return x[()] if x.ndim == 0 else x
+
+    def _disk_paths(self, key):
+        if self.disk_dir is None:
+            return None
+        paths = []
+        while True:
+            path = os.path.join(self.disk_dir, "%s_%d.npy" % (key, len(paths)))
+            if not os.path.exists(path):
+                break
+            paths.append(path)
+        # the marker file is written last, so partial entries are ignored
+        if not paths or not os.path.exists(os.path.join(self.disk_dir, key + ".done")):
+            return None
+        return paths
+
+    def _store(self, key, result):
+        # write every array to a temporary file and rename it into place so
+        # readers never see a half written .npy
+        for i, x in enumerate(result):
+            path = os.path.join(self.disk_dir, "%s_%d.npy" % (key, i))
+            tmp = path + ".tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, np.asarray(x))
+            os.replace(tmp, path)
+        open(os.path.join(self.disk_dir, key + ".done"), 'w').close()
+
+
+def cached_svd(D, solver=svd_pca_serial, cache=None, **options):
+    """
+    solver(N, P, D, **options) through `cache`. Solvers follow the
+    svd_pca_serial signature; a hit returns the stored result tuple as is,
+    including the time the solver reported when it ran.
+    """
+    N, P = D.shape
+    if cache is None:
+        return solver(N, P, D, **options)
+    key = result_key(D, solver, **options)
+    result = cache.get(key)
+    if result is None:
+        result = cache.put(key, solver(N, P, D, **options))
+    return result
@@ -0,0 +1,138 @@
+"""
+Sliding-window PCA over the last W rows of a stream.
+
+The window's rows live in a ring buffer and its centered statistics (row
+count, column means and scatter matrix of covariance.CovarianceStats) are
+kept up to date with rank-b updates: every tick merges the new rows in
+and removes the rows it evicts with the inverse pairwise update, which is
+O(b P^2) instead of the O(W P^2) of recomputing the covariance over the
+window, and keeps streams with a large mean from cancelling digits the
+way raw sums of X_T X would. The covariance is then re-diagonalized by svd_cyclic.cyclic_jacobi warm
+started from the previous tick's eigenvectors, which typically needs only
+one or two sweeps.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+from covariance import CovarianceStats
+from svd_cyclic import cyclic_jacobi
+
+
+class SlidingWindowPCA:
+    """
+    PCA of the most recent `window` rows. n_components limits the
+    components exposed (None keeps all P). The add/remove updates
+    accumulate rounding error, so the statistics are recomputed from the
+    ring buffer every `refresh_every` ticks. tol is passed on to
+    cyclic_jacobi (a looser tol trades accuracy for fewer sweeps per tick).
+    The last `history` tick latencies are kept for latency_stats().
+    """
+
+    def __init__(self, window, n_components=None, tol=None, refresh_every=1000, history=1000):
+        self.window = window
+        self.tol = tol
+        self.n_components = n_components
+        self.refresh_every = refresh_every
+        self.latencies = deque(maxlen = history)
+        self.sweeps = deque(maxlen = history)
+        self.ticks = 0
+
+    def _init(self, P):
+        self.n_features_ = P
+        self._buf = np.zeros((self.window, P))
+        self._head = 0
+        self._count = 0
+        self._stats = CovarianceStats(P)
+        self._E = None
+
+    def push(self, rows):
+        # one tick: slide the window over the new rows and refit
+        t0 = time.perf_counter()
+        rows = np.atleast_2d(np.asarray(rows, dtype = np.float64))
+        if not hasattr(self, '_buf'):
+            self._init(rows.shape[1])
+        elif rows.shape[1] != self.n_features_:
+            raise ValueError("expected %d features, got %d" % (self.n_features_, rows.shape[1]))
+        # rows older than the window would be evicted in the same tick
+        rows = rows[-self.window:]
+        b = rows.shape[0]
+
+        pos = (self._head + np.arange(b)) % self.window
+        n_old = max(self._count + b - self.window, 0)
+        if n_old:
+            # free slots are written first; the last n_old writes land on
+            # the oldest live rows
+            self._stats.remove(CovarianceStats.from_chunk(self._buf[pos[b - n_old:]]))
+        self._buf[pos] = rows
+        self._stats.update(rows)
+        self._head = (self._head + b) % self.window
+        self._count = min(self._count + b, self.window)
+
+        self.ticks += 1
+        if self.ticks % self.refresh_every == 0:
+            self._stats = CovarianceStats.from_chunk(self._live())
+
+        self._solve()
+        self.latencies.append(time.perf_counter() - t0)
+        return self
+
+    def _live(self):
+        # rows currently in the window, oldest first
+        start = (self._head - self._count) % self.window
+        return self._buf[(start + np.arange(self._count)) % self.window]
+
+    def _solve(self):
+        self.mean_ = self._stats.mean.copy()
+        C = self._stats.covariance()
+        e, E, sweeps = cyclic_jacobi(C, warm_start = self._E, tol = self.tol)
+        self._E = E
+        self.sweeps.append(sweeps)
+
+        order = np.argsort(e)[::-1]
+        k = len(e) if self.n_components is None else min(self.n_components, len(e))
+        e = np.clip(e[order], 0, None)
+        self.explained_variance_ = e[:k]
+        self.explained_variance_ratio_ = e[:k] / e.sum() if e.sum() > 0 else np.zeros(k)
+        self.components_ = np.ascontiguousarray(E[:, order[:k]].T)
+
+    def transform(self, X):
+        return np.dot(np.asarray(X) - self.mean_, self.components_.T)
+
+    def latency_stats(self):
+        # per-tick wall time over the recorded history, in seconds
+        if not self.latencies:
+            return {}
+        lat = np.array(self.latencies)
+        return {
+            'ticks': self.ticks,
+            'mean': lat.mean(),
+            'p50': np.percentile(lat, 50),
+            'p95': np.percentile(lat, 95),
+            'p99': np.percentile(lat, 99),
+            'max': lat.max(),
+            'mean_sweeps': np.mean(self.sweeps),
+        }
+
+
+if __name__ == '__main__':
+    # stream a slowly rotating signal through a 500 row window
+    np.random.seed(1)
+    P, W, b = 32, 500, 5
+    basis = np.linalg.qr(np.random.randn(P, P))[0]
+    scales = np.linspace(5, 0.1, P)
+    swpca = SlidingWindowPCA(W, n_components = 4)
+    data = []
+    for tick in range(400):
+        angle = 1e-3 * tick
+        rot = np.eye(P)
+        rot[:2, :2] = [[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]]
+        rows = np.dot(np.random.randn(b, P) * scales, np.dot(basis, rot).T)
+        data.append(rows)
+        swpca.push(rows)
+    ref = np.linalg.eigvalsh(np.cov(np.vstack(data)[-W:].T))[::-1][:4]
+    print("window eigenvalues:", swpca.explained_variance_)
+    print("reference:         ", ref)
+    print("latency:", swpca.latency_stats())
@@ -0,0 +1,75 @@
+"""
+Sparse (scipy.sparse CSR / CSC) input for the covariance stage.
+
+D_T D is accumulated from row chunks of a CSR copy of D with sparse-sparse
+products, so time and memory follow nnz(D) rather than N P; only the P x P
+result is dense. Centering never touches D: the column sums come from the
+sparse matrix and the mean is removed as a rank-one correction,
+M2 = D_T D - n mean mean_T, per chunk in float64 (the chunks are then
+merged with covariance.CovarianceStats.merge as usual). The correction
+cancels digits when |mean| is large against the spread of a column,
+which sparse data with mostly zero entries rarely has.
+
+scipy stays optional: sparse matrices are recognized by duck typing and
+scipy is only needed by whoever builds D.
+"""
+
+import numpy as np
+
+
+def is_sparse(D):
+    # scipy.sparse matrices and arrays without importing scipy
+    return hasattr(D, 'tocsr') and hasattr(D, 'nnz')
+
+
+def _add_product(G, X):
+    # G += X_T X for a sparse chunk X; the product is scattered into G
+    # entry by entry so no dense P x P temporary is made
+    XtX = (X.T @ X).tocoo()
+    G[XtX.row, XtX.col] += XtX.data
+
+
+def sparse_gram(D, chunk_rows=4096, dtype=np.float64):
+    # D_T D accumulated in dtype, chunk_rows rows at a time
+    D = D.tocsr()
+    N, P = D.shape
+    G = np.zeros((P, P), dtype = dtype)
+    for start in range(0, N, chunk_rows):
+        _add_product(G, D[start:start + chunk_rows].astype(dtype))
+    return G
+
+
+def sparse_chunk_stats(X):
+    # row count, column means and centered scatter matrix of a sparse chunk,
+    # centered with the rank-one correction
+    X = X.tocsr().astype(np.float64)
+    n, P = X.shape
+    mean = np.asarray(X.sum(axis = 0)).ravel() / max(n, 1)
+    M2 = np.zeros((P, P))
+    _add_product(M2, X)
+    M2 -= n * np.outer(mean, mean)
+    return n, mean, M2
+
+
+def sparse_project(D, U):
+    # D U as a dense array; the sparse-dense product costs O(nnz(D) k)
+    return np.asarray(D @ U)
+
+
+if __name__ == '__main__':
+    # sparse against densified input: covariance error and time as the
+    # density drops
+    import time
+    import scipy.sparse as sp
+    from covariance import covariance
+    np.random.seed(1)
+    N, P = 20000, 300
+    print("density  nnz       sparse(s)  dense(s)  max |dC|")
+    for density in (0.1, 0.01, 0.001):
+        D = sp.random(N, P, density = density, format = 'csr', dtype = np.float32)
+        t0 = time.time()
+        C_sparse, _ = covariance(D)
+        t1 = time.time()
+        C_dense, _ = covariance(D.toarray())
+        t2 = time.time()
+        print("%-8g %-9d %-10.3f %-9.3f %.1e" % (density, D.nnz, t1 - t0, t2 - t1, np.abs(C_sparse - C_dense).max()))
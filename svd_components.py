@@ -0,0 +1,116 @@
+"""
+Jacobi on the independent blocks of a nearly block-diagonal matrix.
+
+Off-diagonal entries that fail the Jacobi threshold |a_ij| <= tol *
+sqrt(|a_ii a_jj|) are entries the solvers already treat as converged.
+Dropping them splits the pattern of A into connected components; after a
+symmetric permutation A is block-diagonal, every block is solved on its
+own (optionally on a thread pool) and the eigenpairs are scattered back.
+For k blocks of size b the cost drops from O(P^3) to O(k b^3), and the
+error from the dropped entries is at most ||dropped||_2 <= tol max|a_ii|
+per eigenvalue.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Helper import s_driver
+from svd_cyclic import cyclic_jacobi
+
+
+def components(A, tol=None):
+    # index arrays of the connected components of the off-diagonal entries
+    # above the threshold, by breadth-first search over the boolean pattern
+    P = A.shape[0]
+    if tol is None:
+        tol = np.finfo(np.result_type(A.dtype, np.float32)).eps
+    d = np.sqrt(np.abs(np.diag(A)))
+    linked = np.abs(A) > tol * np.outer(d, d)
+    np.fill_diagonal(linked, False)
+    seen = np.zeros(P, dtype = bool)
+    blocks = []
+    for seed in range(P):
+        if seen[seed]:
+            continue
+        seen[seed] = True
+        block, frontier = [seed], np.array([seed])
+        while len(frontier):
+            frontier = np.flatnonzero(linked[frontier].any(axis = 0) & ~seen)
+            seen[frontier] = True
+            block.extend(frontier)
+        blocks.append(np.sort(np.array(block)))
+    return blocks
+
+
+def component_jacobi(A, tol=None, solver=None, n_jobs=1, stats=None):
+    """
+    Eigen-decomposition of the symmetric matrix A, one connected component
+    of its thresholded pattern at a time. solver(S) returns (e, E, count)
+    for a block S (cyclic_jacobi with the same tol by default); n_jobs > 1
+    solves blocks on a thread pool. If a dict is passed as stats, the block
+    sizes are stored in stats['blocks'].
+
+    Returns eigenvalues e, eigenvectors E (as columns, unsorted) and the
+    largest count returned for a block.
+    """
+    dtype = np.result_type(A.dtype, np.float32)
+    P = A.shape[0]
+    if tol is None:
+        tol = np.finfo(dtype).eps
+    if solver is None:
+        solver = lambda S: cyclic_jacobi(S, tol = tol)
+    blocks = components(A, tol)
+    if stats is not None:
+        stats['blocks'] = [len(b) for b in blocks]
+
+    def solve(b):
+        if len(b) == 1:
+            return A[b, b].astype(dtype), np.ones((1, 1), dtype = dtype), 0
+        return solver(A[np.ix_(b, b)])
+
+    # largest blocks first so the pool is not left waiting on one of them
+    blocks.sort(key = len, reverse = True)
+    if n_jobs is not None and n_jobs > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers = n_jobs) as pool:
+            results = list(pool.map(solve, blocks))
+    else:
+        results = [solve(b) for b in blocks]
+
+    # each block keeps its own indices as eigenpair slots
+    e = np.empty(P, dtype = dtype)
+    E = np.zeros((P, P), dtype = dtype)
+    count = 0
+    for b, (eb, Eb, cb) in zip(blocks, results):
+        e[b] = eb
+        E[np.ix_(b, b)] = Eb
+        count = max(count, cb)
+    return e, E, count
+
+
+def svd_pca_components(N, P, D, full_matrices=True, **options):
+    # Helper.s_driver with component_jacobi; options go to it
+    return s_driver(component_jacobi, D, full_matrices, **options)
+
+
+if __name__ == '__main__':
+    # permuted block-diagonal covariance: full cyclic Jacobi against the
+    # per-component solve
+    np.random.seed(1)
+    print("P     blocks  cyclic(s)  components(s)  rel. err")
+    for P, b in ((128, 16), (256, 32), (256, 8)):
+        C = np.zeros((P, P), dtype = np.float32)
+        for r0 in range(0, P, b):
+            X = np.random.randn(2 * b, b)
+            C[r0:r0 + b, r0:r0 + b] = np.dot(X.T, X)
+        perm = np.random.permutation(P)
+        C = C[np.ix_(perm, perm)]
+        t0 = time.time()
+        cyclic_jacobi(C)
+        t1 = time.time()
+        stats = {}
+        e, E, _ = component_jacobi(C, stats = stats)
+        t2 = time.time()
+        err = np.abs(np.sort(e) - np.linalg.eigvalsh(C.astype(np.float64))).max() / e.max()
+        print("%-5d %-7d %-10.3f %-14.3f %.1e" % (P, len(stats['blocks']), t1 - t0, t2 - t1, err))
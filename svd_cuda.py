@@ -14,6 +14,14 @@ from pycuda import compiler, gpuarray, tools
 
 import time
 
+from checkpoint import load_snapshot, save_snapshot
+from compact import compact_format, gram, project
+from memory import device_footprint, plan
+from profiling import current, phase
+from sparse_input import is_sparse
+from Helper import s_active, s_scale, s_sort
+from svd_cyclic import deflated_schedule
+
 """
 ###############################################################################
                     define kernel codes and how to call them
@@ -183,7 +191,7 @@ class gpuMul:
 
             dev_mul(
                 self.A_gpu, rA, cA,
-                self.B_gpu, rB, cA,
+                self.B_gpu, rB, cB,
                 self.C_gpu,
                 block = (16, 16, 1),
                 grid = (grid_x, grid_y, 1)
@@ -236,13 +244,16 @@ class computeParams:
             }
         """
 
-    def compute_params(self, A, P, itr, iterblock):
+    def compute_params(self, A, P, itr, iterblock, pairs=None):
+        # pairs: number of (k, l) pairs in the round (P/2 unless deflated)
         self.A_gpu = gpuarray.to_gpu(A)
         self.iterBlock_device = gpuarray.to_gpu(iterblock)
         self.dev_sin = gpuarray.empty((P, P), np.float32)
         self.dev_cos = gpuarray.empty((P, P), np.float32)
         # self.iterBlock_device = gpuarray.empty((P-1)*P / 2 * 2), astype.int)
-        if (P % 2 == 0):
+        if pairs is not None:
+            grid_size = np.int(pairs)
+        elif (P % 2 == 0):
             grid_size = np.int(P / 2)
         else:
             grid_size = np.int(P / 2 + 1)
@@ -264,7 +275,7 @@ class computeParams:
 
 class dimUpdate:
 
-    def __init__(self,P):
+    def __init__(self, P, E0=None):
 
         self.row_update_kernel_code = """
             __global__ void kernel_row_update(int iter, float *device_A, float *device_X, int P, float *device_sine, float *device_cosine, int *device_IterBlockToElem) {
@@ -327,10 +338,15 @@ class dimUpdate:
             }
         """
 
-        E = np.diag(np.ones((P), dtype = np.float32))
+        # the kernels rotate rows, so the device holds the eigenvectors
+        # transposed; E0 seeds them with a previous eigenbasis (as columns)
+        if E0 is None:
+            E = np.diag(np.ones((P), dtype = np.float32))
+        else:
+            E = np.ascontiguousarray(E0.T, dtype = np.float32)
         self.device_eigenvectors = gpuarray.to_gpu(E)
 
-    def row_update(self, itr, A, X_device, P, sin, cos, iterBlock):
+    def row_update(self, itr, A, X_device, P, sin, cos, iterBlock, pairs=None):
         self.A_device = gpuarray.to_gpu(A)
         self.X_device = gpuarray.to_gpu(X_device)
         self.dev_sin = gpuarray.to_gpu(sin)
@@ -339,7 +355,9 @@ class dimUpdate:
 
         mod1 = compiler.SourceModule(self.row_update_kernel_code)
         row_update_code = mod1.get_function("kernel_row_update")
-        if (P % 2 == 0):
+        if pairs is not None:
+            grid_size = np.int(pairs)
+        elif (P % 2 == 0):
             grid_size = np.int(P / 2)
         else:
             grid_size = np.int(P / 2 + 1)
@@ -354,14 +372,18 @@ class dimUpdate:
         )
         return self.X_device.get()
 
-    def col_update(self, itr, A, X_device, P, sin, cos, iterBlock):
+    def col_update(self, itr, A, X_device, P, sin, cos, iterBlock, fetch=True, pairs=None):
+        # fetch=False leaves the rotated eigenvectors on the device (see
+        # eigenvectors()) instead of copying all P x P back every round
         self.A_device = gpuarray.to_gpu(A)
         self.X_device = gpuarray.to_gpu(X_device)
         self.dev_sin = gpuarray.to_gpu(sin)
         self.dev_cos = gpuarray.to_gpu(cos)
         self.iterBlock_device = gpuarray.to_gpu(iterBlock)
 
-        if (P % 2 == 0):
+        if pairs is not None:
+            grid_size = np.int(pairs)
+        elif (P % 2 == 0):
             grid_size = np.int(P / 2)
         else:
             grid_size = np.int(P / 2 + 1)
@@ -379,6 +401,10 @@ class dimUpdate:
             grid = (np.int(grid_size), np.int(grid_size),1)
         )
 
+        if fetch:
+            return self.device_eigenvectors.get()
+
+    def eigenvectors(self):
         return self.device_eigenvectors.get()
 
 """
@@ -388,10 +414,36 @@ class dimUpdate:
 """
 
 
-def cudaSVD(N, P, D):
-
-    # Perform SVD for D_T
-    # Get eigen values and eigen vectors for D_T*D
+def cudaJacobi(A, warm_start=None, checkpoint=None, checkpoint_every=1, resume_from=None,
+               defer_vectors=None, deflate=False):
+
+    # Cyclic Jacobi on the symmetric P x P matrix A using the chess
+    # tournament ordering: every round rotates P/2 disjoint (p, q) pairs in
+    # parallel. Returns the rotated A and the accumulated eigenvectors (as
+    # columns). warm_start=U_prev first rotates A into a previous
+    # eigenbasis, A' = U_prev_T A U_prev, and composes the sweeps onto U_prev.
+    # checkpoint=path snapshots A, the eigenvectors and the sweep / round
+    # counters every checkpoint_every sweeps; resume_from=path continues
+    # from such a snapshot with bit-identical results.
+    # defer_vectors=w keeps the eigenvectors on the device between rounds
+    # and reads them back only for snapshots and the result. Every round
+    # rotates all P/2 pairs, so the width w of the host solvers'
+    # RotationLog does not apply; what is saved is the P x P readback per
+    # round.
+    # deflate=True rebuilds the round-robin schedule before every sweep over
+    # the indices that still have an off-diagonal entry above the
+    # svd_cyclic threshold (float32 epsilon), so each round launches one
+    # block per active pair instead of P/2, and stops once none are left.
+    P = A.shape[0]
+    counter = 0
+    itr = 0
+    if resume_from is not None:
+        snap = load_snapshot(resume_from)
+        A, warm_start = snap['A'], snap['eigenvectors']
+        counter, itr = int(snap['sweep']), int(snap['round'])
+    elif warm_start is not None:
+        warm_start = np.asarray(warm_start, dtype = np.float32)
+        A = np.dot(np.dot(warm_start.T, A), warm_start).astype(np.float32)
 
     chess_params_kernel_code = """
       __device__ void chess_tourney_params(int P, int *row_pair, int iter) {
@@ -419,88 +471,151 @@ def cudaSVD(N, P, D):
         free(row_pair);
     }
     """
-    ###########################################################################
-    # STREAM PARALLELIZATION
-    t = cuda_Transpose()
-    g = gpuMul()
+    with phase('schedule', launches = 1, d2h_bytes = (P-1) * 2 * int(np.ceil(P/2)) * 4):
+        iterBlock_device = gpuarray.empty(((P-1), np.int(np.ceil(P/2)), 2), np.int32)
+        mod = compiler.SourceModule(chess_params_kernel_code)
+        dev_chess = mod.get_function("kernel_compute_all_chess_params")
 
-    iterBlock_device = gpuarray.empty(((P-1), np.int(np.ceil(P/2)), 2), np.int32)
-    mod = compiler.SourceModule(chess_params_kernel_code)
-    dev_chess = mod.get_function("kernel_compute_all_chess_params")
+        dev_chess(np.int32(P), iterBlock_device, block = (np.int(P-1), np.int(np.ceil(P/2)), 1),
+                  grid = (np.int(P-1), np.int(P-1),1))
+        iterBlock = iterBlock_device.get()
 
-    dev_chess(np.int32(P), iterBlock_device, block = (np.int(P-1), np.int(np.ceil(P/2)), 1),
-              grid = (np.int(P-1), np.int(P-1),1))
-    iterBlock = iterBlock_device.get()
-    # cudaAsynccopy something
-    D_T = t.transpose_parallel(D)
-    ###########################################################################
-    A = g.MatMul(D_T, np.int32(P), np.int32(N), D, np.int32(N), np.int32(P))
-    eigenvectors = np.ones((P, P), np.float32)
-    counter = 0
+    eigenvectors = np.ones((P, P), np.float32) if warm_start is None else warm_start.T
 
     MAX_SWEEPS = 30
     EPSILON = 1e-4
     THRESHOLD = 1e-4
     MAX_BLOCK_SIZE = 1024
-    MAX_SWEEPS = 30
     MAX_ITER = 10000000
     MULTIPLY_BLOCK_SIZE = 16
 
-    itr = 0
     cP = computeParams()
-    dU = dimUpdate(P)
+    dU = dimUpdate(P, warm_start)
     X = np.zeros((P,P), dtype = np.float32)
-    while(counter < 30):
-        while(itr < P-1):
+    rounds, pairs = P-1, None
+    # one 'sweep' record per sweep when profiling.profiled() is active. Per
+    # round compute_params, row_update and col_update are three launches;
+    # they upload A, X, sin, cos (P x P float32 each, A three times, X, sin
+    # and cos twice) and the schedule three times, and read back sin, cos,
+    # A twice, X and, unless deferred, the eigenvectors
+    prof = current()
+    while(counter < MAX_SWEEPS):
+        if prof is not None:
+            t_sweep, start = time.perf_counter(), itr
+        if deflate:
+            active = s_active(A, np.finfo(np.float32).eps)
+            if len(active) == 0:
+                break
+            # same layout as the device table: row itr holds the flattened
+            # pairs of round itr, padded to P entries
+            schedule = deflated_schedule(active)
+            rounds, pairs = len(schedule), len(schedule[0])
+            iterBlock = np.zeros((rounds, P), np.int32)
+            iterBlock[:, :2*pairs] = np.reshape(schedule, (rounds, -1))
+        while(itr < rounds):
             # Compute rotation parameters: sine and cosine
             # for all (p, q), q>p
-            sin, cos = cP.compute_params(A, np.int32(P), np.int32(itr), iterBlock)
-            # row update
+            sin, cos = cP.compute_params(A, np.int32(P), np.int32(itr), iterBlock, pairs)
+            # row update; a deflated round leaves some rows untouched, and
+            # col_update reads their entries of X, so start X from A (= A_T)
+            if deflate:
+                X = A
             X = dU.row_update(np.int32(itr), np.float32(A), np.float32(X),
-                            np.int32(P), np.float32(sin), np.float32(cos), iterBlock)
+                            np.int32(P), np.float32(sin), np.float32(cos), iterBlock, pairs)
         # col update
             eigenvectors = dU.col_update(np.int32(itr), np.float32(A), np.float32(X),
-                                        np.int32(P), np.float32(sin), np.float32(cos), iterBlock)
+                                        np.int32(P), np.float32(sin), np.float32(cos), iterBlock,
+                                        fetch = defer_vectors is None, pairs = pairs)
+            # col_update rotates A on the device; bring it back for the next round
+            A = dU.A_device.get()
+            if deflate:
+                # col_update rewrites the rows of the round's pairs only; the
+                # other rows' entries in those columns follow from symmetry
+                touched = iterBlock[itr, :2*pairs]
+                A[:, touched] = A[touched].T
             itr = itr + 1
 
+        if prof is not None:
+            n, mat = rounds - start, 4 * P * P
+            prof.add('sweep', time.perf_counter() - t_sweep, 18.0 * P * n * (pairs or P // 2),
+                     12.0 * P * n * (pairs or P // 2) * 4, launches = 3 * n,
+                     device_bytes = device_footprint(0, P, tiled = True)['sweep'],
+                     rotations = n * (pairs or P // 2),
+                     h2d_bytes = n * (9 * mat + 3 * iterBlock.nbytes),
+                     d2h_bytes = n * ((6 if defer_vectors is None else 5) * mat + iterBlock.nbytes))
+        itr = 0
         counter = counter + 1
-    eigenvectors_T = t.transpose_parallel(eigenvectors)
-
-    eigenvalues = np.ones(P)
-    e_indices = np.ones(P)
-
-    for i in range(P):
-        eigenvalues[i] = A[i][i]
-        e_indices[i] = i
-
-     # sort eigenvalues in descending order along with corresponding indices
-    eigenvalues = np.sort(eigenvalues)
-    new_indices = np.argsort(e_indices)
-    eigenvalues = np.flip(eigenvalues)
-    new_indices = np.flip(new_indices)
-
-    # compute sigma
-    SIGMA = np.ones(P, np.float32)
-    sum_variance = 0.0
-    sum_variance = np.sum(eigenvalues)
-    SIGMA = np.sqrt(eigenvalues)
-    U = np.empty((P,P), dtype = np.float32)
-    # compute U
-    for i in range(P):
-        for j in range(P):
-            U[i][j] = eigenvectors[i][new_indices[j]]
-
-    # calculate V_T
-
-    inv_SIGMA = np.ones((N, P), np.float32)
-    for i in range(P):
-        inv_SIGMA[i][i] = 1.0 / SIGMA[i]
-
-    U_T = t.transpose_parallel(U)
-    prod = g.MatMul(inv_SIGMA, np.int32(N), np.int32(P), U_T, np.int32(P), np.int32(P))
-    # V_T = inv_SIGMA * U_T * D_T
-    V_T = g.MatMul(prod, np.int32(N), np.int32(P), D_T, np.int32(P), np.int32(N))
-    print(U)
+        if checkpoint is not None and counter % checkpoint_every == 0:
+            if defer_vectors is not None:
+                eigenvectors = dU.eigenvectors()
+            save_snapshot(checkpoint, A = A, eigenvectors = eigenvectors.T,
+                          sweep = counter, round = itr)
+
+    eigenvectors = dU.eigenvectors()
+    # the device rotates rows of the transposed eigenvector matrix
+    return A, np.ascontiguousarray(eigenvectors.T)
+
+
+def cudaSVD(N, P, D, full_matrices=True, memory_budget=None, k=None, **options):
+
+    # Perform SVD for D_T
+    # Get eigen values and eigen vectors for D_T*D
+    # full_matrices=False returns the economy factors: U (PxP), SIGMA (P)
+    # and V_T (PxN) instead of the zero padded (NxN) V_T; the remaining
+    # options (warm_start, checkpoint, resume_from, ...) go to cudaJacobi.
+    # A compact (float16 / bfloat16) or scipy.sparse D never goes to the
+    # device as a whole: the Gram and projection stages run on the host
+    # (compact.py, sparse_input.py) and only the P x P solve runs on the GPU
+    # memory_budget=bytes checks the host and device estimates of
+    # memory.plan before anything is allocated: the padded V_T is dropped
+    # and host tiles shrink to fit, otherwise MemoryError is raised
+    # k keeps the k leading triplets; V_T is only formed for those
+
+    ###########################################################################
+    # STREAM PARALLELIZATION
+    t = cuda_Transpose()
+    g = gpuMul()
+    compact = compact_format(D) is not None or is_sparse(D)
+    tile_rows = 4096
+    if memory_budget is not None:
+        settings = plan(N, P, memory_budget, 4, full_matrices, compact, device = True)
+        full_matrices, tile_rows = settings['full_matrices'], settings['tile_rows']
+    device = device_footprint(N, P, compact)
+
+    # cudaAsynccopy something
+    ###########################################################################
+    # 'load', 'covariance', 'sort/permute' and 'V_T' phases for
+    # profiling.py; device byte counts are float32 transfers
+    nD = 4 * N * P
+    if compact:
+        A = gram(D, tile_rows)
+    else:
+        with phase('load', nbytes = 2 * nD, launches = 1, h2d_bytes = nD, d2h_bytes = nD,
+                   device_bytes = device['load']):
+            D_T = t.transpose_parallel(D)
+        with phase('covariance', flops = 2.0 * N * P * P, nbytes = 2 * nD, launches = 1,
+                   h2d_bytes = 2 * nD, d2h_bytes = 4 * P * P, device_bytes = device['covariance']):
+            A = g.MatMul(D_T, np.int32(P), np.int32(N), D, np.int32(N), np.int32(P))
+    A, eigenvectors = cudaJacobi(A, **options)
+
+    # eigenvalues are the diagonal of the rotated A; Helper.s_sort orders
+    # them, permutes the eigenvectors and masks zero singular values
+    SIGMA, U, inv_SIGMA = s_sort(np.diag(A).astype(np.float32), eigenvectors, N)
+    if k is not None:
+        SIGMA, U, inv_SIGMA = SIGMA[:k], np.ascontiguousarray(U[:, :k]), inv_SIGMA[:k]
+    rank = U.shape[1]
+
+    # U_T * D_T on the device (or tiled on the host for compact D)
+    if compact:
+        with phase('V_T', flops = 2.0 * N * P * rank, nbytes = nD):
+            V_T = project(D, U, tile_rows).T
+    else:
+        with phase('V_T', flops = 2.0 * N * P * rank, nbytes = 2 * nD, launches = 2,
+                   h2d_bytes = 8 * P * rank + nD, d2h_bytes = 4 * P * rank + 4 * N * rank,
+                   device_bytes = device['V_T']):
+            U_T = t.transpose_parallel(U)
+            V_T = g.MatMul(U_T, np.int32(rank), np.int32(P), D_T, np.int32(P), np.int32(N))
+    V_T = s_scale(V_T, inv_SIGMA, N, full_matrices)
 
     return SIGMA, U, V_T
 
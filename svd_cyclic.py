@@ -0,0 +1,290 @@
+"""
+Host (NumPy) cyclic Jacobi, mirroring the GPU path in svd_cuda.py.
+
+Each sweep walks the same chess tournament ordering as
+kernel_compute_all_chess_params: P-1 rounds of P/2 disjoint (k, l) pairs.
+The pairs of a round do not share rows or columns, so the whole round is
+applied as one vectorized row update followed by one column update, which
+is what the row_update / col_update kernels do on the device.
+"""
+
+import time
+
+import numpy as np
+
+from Helper import RotationLog, s_active, s_driver
+from checkpoint import load_snapshot, save_snapshot
+from profiling import current, phase
+
+
+def chess_schedule(P):
+    # (rounds, P/2, 2) array of (k, l) pairs, k < l, for one sweep. Same
+    # formula as chess_tourney_params; odd P gets a dummy index P whose
+    # pairs are dropped, leaving one idle index per round.
+    M = P + (P % 2)
+    rounds = []
+    for itr in range(M - 1):
+        local = np.arange(M // 2)
+        index1 = (local + itr) % (M - 1)
+        index2 = (M - local + itr - 1) % (M - 1)
+        index2[0] = M - 1
+        pairs = np.stack([np.minimum(index1, index2), np.maximum(index1, index2)], axis = 1)
+        rounds.append(pairs[pairs[:, 1] < P])
+    return rounds
+
+
+def deflated_schedule(active):
+    # chess_schedule over the indices still in the active set, mapped back
+    # to indices of the full matrix
+    return [active[pairs] for pairs in chess_schedule(len(active))]
+
+
+def jacobi_params(app, aqq, apq):
+    # cosine / sine that annihilate apq, vectorized over pairs; same
+    # formulas as v1.jacobi_serial and kernel_compute_params
+    y = 0.5 * (aqq - app)
+    d = np.abs(y) + np.sqrt(apq * apq + y * y)
+    r = np.sqrt(apq * apq + d * d)
+    zero = r == 0
+    r = np.where(zero, 1, r)
+    c = np.where(zero, 1, d / r)
+    s = np.where(zero, 0, apq / r)
+    s = np.where(y < 0, -s, s)
+    return c.astype(app.dtype), s.astype(app.dtype)
+
+
+def rotate_round(A, E, k, l, c, s):
+    # apply the disjoint rotations (k[i], l[i], c[i], s[i]) as A <- J_T A J
+    # and E <- E J; row update, then column update, then eigenvectors
+    # (E=None leaves the eigenvectors to a RotationLog)
+    cc, ss = c[:, None], s[:, None]
+    Ak, Al = A[k], A[l]
+    A[k] = cc * Ak - ss * Al
+    A[l] = ss * Ak + cc * Al
+    Ak, Al = A[:, k], A[:, l]
+    A[:, k] = Ak * c - Al * s
+    A[:, l] = Ak * s + Al * c
+    if E is None:
+        return
+    Ek, El = E[:, k], E[:, l]
+    E[:, k] = Ek * c - El * s
+    E[:, l] = Ek * s + El * c
+
+
+def greedy_pairs(A, tol, iu, ju):
+    # multi-pivot selection: rank the off-diagonal entries above threshold
+    # by |a_kl| and greedily take the largest pairs that share no index,
+    # giving up to P/2 disjoint rotations for one batched round
+    P = A.shape[0]
+    off = np.abs(A[iu, ju])
+    d = np.abs(np.diag(A))
+    cand = np.flatnonzero(off > tol * np.sqrt(d[iu] * d[ju]))
+    used = np.zeros(P, dtype = bool)
+    ks, ls = [], []
+    # work through the candidates in batches of the 4P largest; before each
+    # batch drop candidates that touch an index already taken, which keeps
+    # both the sort and the Python loop short
+    while len(cand) and len(ks) < P // 2:
+        top = min(len(cand), 4 * P)
+        if top < len(cand):
+            part = np.argpartition(-off[cand], top - 1)
+            batch, cand = cand[part[:top]], cand[part[top:]]
+        else:
+            batch, cand = cand, cand[:0]
+        batch = batch[np.argsort(-off[batch], kind = 'stable')]
+        for k, l in zip(iu[batch].tolist(), ju[batch].tolist()):
+            if not (used[k] or used[l]):
+                used[k] = used[l] = True
+                ks.append(k)
+                ls.append(l)
+                if len(ks) == P // 2:
+                    break
+        cand = cand[~(used[iu[cand]] | used[ju[cand]])]
+    return np.array(ks, dtype = np.int64), np.array(ls, dtype = np.int64)
+
+
+def cyclic_jacobi(A, warm_start=None, tol=None, max_sweeps=30,
+                  checkpoint=None, checkpoint_every=1, resume_from=None,
+                  ordering='chess', stats=None, defer_vectors=None, deflate=False):
+    """
+    Eigen-decomposition of the symmetric matrix A by cyclic Jacobi sweeps.
+
+    A pair is rotated only while |a_kl| > tol * sqrt(|a_kk a_ll|) (tol
+    defaults to the machine epsilon of A's dtype); the solve stops after
+    the first sweep that rotates nothing. warm_start=U_prev starts from a
+    previous eigenbasis: A is first rotated to U_prev_T A U_prev, which is
+    nearly diagonal when A has drifted only slightly, and the sweeps'
+    rotations are composed onto U_prev. checkpoint=path snapshots A, E and
+    the sweep counter (and the index set of a deflated schedule) every
+    checkpoint_every sweeps (see checkpoint.py);
+    resume_from=path continues from a snapshot with bit-identical results.
+
+    ordering='chess' walks the fixed round-robin schedule of the GPU path;
+    ordering='greedy' picks every round from the current magnitudes
+    (greedy_pairs), combining classical Jacobi's choice of large pivots
+    with round-level parallelism. A greedy "sweep" is P-1 such rounds.
+    If a dict is passed as stats, the rounds and rotations applied are
+    added to stats['rounds'] and stats['rotations'].
+
+    defer_vectors=w records each round's rotations in a Helper.RotationLog
+    and updates E with GEMMs over at most w columns. Rounds wider than w
+    (early sweeps) still rotate E directly, but once A is nearly diagonal
+    only a few pairs per round are active and many rounds are applied to E
+    with a single matrix multiply.
+
+    deflate=True shrinks the problem as it converges: before every sweep
+    the indices whose off-diagonal entries all pass the threshold are
+    dropped (Helper.s_active) and, once the set has shrunk by an eighth,
+    the round-robin schedule (or the greedy candidate list) is rebuilt
+    over the rest, so a sweep with m active indices costs m-1 rounds
+    instead of P-1. The set is recomputed from A
+    each sweep, so indices that a later rotation pushes back above the
+    threshold rejoin it. stats['active'] then lists the active set size of
+    every sweep.
+
+    Returns eigenvalues e, eigenvectors E (as columns, unsorted) and the
+    number of sweeps that applied at least one rotation. A is not modified.
+    """
+    dtype = np.result_type(A.dtype, np.float32)
+    P = A.shape[0]
+    if tol is None:
+        tol = np.finfo(dtype).eps
+    sweeps = 0
+    scheduled = np.arange(P)
+    if resume_from is not None:
+        snap = load_snapshot(resume_from)
+        A, E, sweeps = snap['A'], snap['E'], int(snap['sweeps'])
+        # the index set the deflated schedule was built over
+        scheduled = snap.get('scheduled', scheduled)
+    elif warm_start is None:
+        A = np.array(A, dtype = dtype)
+        E = np.eye(P, dtype = dtype)
+    else:
+        E = np.array(warm_start, dtype = dtype)
+        A = np.dot(np.dot(E.T, A.astype(dtype, copy = False)), E)
+
+    if ordering not in ('chess', 'greedy'):
+        raise ValueError("unknown ordering %r" % (ordering,))
+    if stats is not None:
+        stats.setdefault('rounds', 0)
+        stats.setdefault('rotations', 0)
+        if deflate:
+            stats.setdefault('active', [])
+    log = None if defer_vectors is None else RotationLog(defer_vectors)
+    with phase('schedule'):
+        schedule = deflated_schedule(scheduled)
+    iu, ju = np.triu_indices(len(scheduled), 1)
+    iu, ju = scheduled[iu], scheduled[ju]
+    # one 'sweep' record per sweep when profiling.profiled() is active
+    prof = current()
+    while sweeps < max_sweeps:
+        if prof is not None:
+            t_sweep, considered, applied = time.perf_counter(), 0, 0
+        if deflate:
+            active = s_active(A, tol)
+            if len(active) == 0:
+                break
+            if stats is not None:
+                stats['active'].append(len(active))
+            # rebuilding costs O(P) rounds of bookkeeping, so keep the
+            # current schedule unless the set shrank noticeably or an index
+            # outside it became active again
+            if len(active) < 0.875 * len(scheduled) or not np.isin(active, scheduled).all():
+                with phase('schedule'):
+                    scheduled = active
+                    schedule = deflated_schedule(active)
+                    iu, ju = np.triu_indices(len(active), 1)
+                    iu, ju = active[iu], active[ju]
+        rotated = False
+        for pairs in schedule:
+            if ordering == 'greedy':
+                k, l = greedy_pairs(A, tol, iu, ju)
+                if len(k) == 0:
+                    break
+            else:
+                k, l = pairs[:, 0], pairs[:, 1]
+            akk, all_, akl = A[k, k], A[l, l], A[k, l]
+            active = np.abs(akl) > tol * np.sqrt(np.abs(akk * all_))
+            if prof is not None:
+                considered += len(active)
+            if not active.any():
+                continue
+            k, l = k[active], l[active]
+            if prof is not None:
+                applied += len(k)
+            c, s = jacobi_params(akk[active], all_[active], akl[active])
+            if log is None:
+                rotate_round(A, E, k, l, c, s)
+            else:
+                rotate_round(A, None, k, l, c, s)
+                log.add(E, k, l, c, s)
+            rotated = True
+            if stats is not None:
+                stats['rounds'] += 1
+                stats['rotations'] += len(k)
+        if prof is not None:
+            # a rotation updates two rows and two columns of A and two
+            # columns of E: about 18 P flops, 12 P words read and written
+            prof.add('sweep', time.perf_counter() - t_sweep, 18.0 * P * applied,
+                     12.0 * P * applied * A.itemsize, rotations = applied,
+                     skipped = considered - applied)
+        if not rotated:
+            break
+        sweeps += 1
+        if checkpoint is not None and sweeps % checkpoint_every == 0:
+            if log is not None:
+                log.flush(E)
+            save_snapshot(checkpoint, A = A, E = E, sweeps = sweeps, scheduled = scheduled)
+
+    if log is not None:
+        log.flush(E)
+    return np.diag(A).copy(), E, sweeps
+
+
+def svd_pca_cyclic(N, P, D, full_matrices=True, **options):
+    # host counterpart of svd_cuda.cudaSVD: Helper.s_driver with
+    # cyclic_jacobi; options are passed on to it
+    return s_driver(cyclic_jacobi, D, full_matrices, **options)
+
+
+if __name__ == '__main__':
+    # warm start benchmark: a covariance matrix that drifts a little between
+    # refits (e.g. a sliding window) is re-diagonalized cold and warm
+    np.random.seed(1)
+    P, steps = 64, 6
+    for dtype in (np.float32, np.float64):
+        X = np.random.randn(4 * P, P)
+        C = np.dot(X.T, X)
+        U_prev = None
+        print("%s: step  cold sweeps  warm sweeps  cold time  warm time" % np.dtype(dtype).name)
+        for step in range(steps):
+            drift = 1e-3 * np.random.randn(P, P)
+            C = C + np.dot(drift.T, drift) * np.trace(C) / P
+            A = C.astype(dtype)
+            t0 = time.time()
+            e_cold, E_cold, cold = cyclic_jacobi(A)
+            t1 = time.time()
+            if U_prev is None:
+                e_warm, E_warm, warm = e_cold, E_cold, cold
+            else:
+                e_warm, E_warm, warm = cyclic_jacobi(A, warm_start = U_prev)
+            t2 = time.time()
+            U_prev = E_warm
+            err = np.abs(np.sort(e_warm) - np.linalg.eigvalsh(C)).max() / np.abs(e_warm).max()
+            print("%13d  %11d  %11d  %8.4fs  %8.4fs  (rel. err %.1e)" % (step, cold, warm, t1 - t0, t2 - t1, err))
+
+    # ordering benchmark: classical (tree pivot, one rotation per step),
+    # cyclic chess rounds and greedy multi-pivot rounds
+    from v1 import jacobi_serial
+    print("P     ordering   rounds  rotations  time")
+    for P in (32, 64, 128):
+        X = np.random.randn(2 * P, P).astype(np.float32)
+        C = np.dot(X.T, X)
+        t0 = time.time()
+        _, _, n = jacobi_serial(C.copy(), pivot = 'tree')
+        print("%-5d %-10s %6d  %9d  %.3fs" % (P, 'classical', n, n, time.time() - t0))
+        for ordering in ('chess', 'greedy'):
+            stats = {}
+            t0 = time.time()
+            cyclic_jacobi(C, ordering = ordering, stats = stats)
+            print("%-5d %-10s %6d  %9d  %.3fs" % (P, ordering, stats['rounds'], stats['rotations'], time.time() - t0))
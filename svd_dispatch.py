@@ -0,0 +1,233 @@
+"""
+svd(D): one entry point that picks the decomposition engine.
+
+Every engine is an svd_pca_* driver with the usual (sigma, U, VT, t)
+result. Engines that cannot handle the input are ruled out first: no
+CUDA device, float64 D on a float32-only engine, a sparse, 16-bit or
+integer D on an engine that needs a dense float array, a P too large for
+the dense P x P working set of the serial solver. The remaining engines are ranked
+by a cost model
+
+    t = overhead + gram nnz P + solve P^3 + rotate P^4 + project nnz k
+
+(one coefficient per term and engine; nnz is N P for dense D and the
+stored entries of a sparse D, k the number of triplets asked for, P by
+default; the P^4 term covers the Python rotation loop of the serial
+solver). The coefficients ship with defaults measured on a single core,
+and calibrate() refits them on the current machine and stores them as
+JSON in the user configuration directory ($XDG_CONFIG_HOME/svd_pca, or
+~/.config/svd_pca); svd() reads that file when it exists.
+explain=True returns the estimates and the reasons alongside the result.
+"""
+
+import json
+import os
+import time
+from importlib import import_module
+
+import numpy as np
+
+from compact import compact_format
+from sparse_input import is_sparse
+
+
+# name -> (module, driver, notes on what the engine accepts)
+ENGINES = {
+    'serial': ('v1', 'svd_pca_serial', {'max_P': 256}),
+    'cyclic': ('svd_cyclic', 'svd_pca_cyclic', {}),
+    'block': ('svd_block', 'svd_pca_block', {}),
+    'mixed': ('mixed', 'svd_pca_mixed', {}),
+    'tsqr': ('tsqr', 'svd_pca_tsqr', {'tall': 8}),
+    'packed': ('packed', 'svd_pca_packed', {'dense': True}),
+    'cuda': ('svd_cuda', 'cudaSVD', {'float32': True, 'device': True}),
+}
+
+TERMS = ('overhead', 'gram', 'solve', 'rotate', 'project')
+
+# seconds per unit of each term, fitted with calibrate() on one CPU core;
+# 'project' is the D U product of the V_T stage (about 1.6e-10 s per
+# multiply-add in float32, 2.7e-10 in float64), split off the 'gram' fit;
+# 'cuda' is a rough guess (kernel launches dominate small P) until it is
+# calibrated on a machine with a device
+DEFAULT_COEFFICIENTS = {
+    'serial': {'overhead': 2.8e-3, 'gram': 0.0, 'solve': 1.1e-5, 'rotate': 6.1e-10, 'project': 1.6e-10},
+    'cyclic': {'overhead': 1e-2, 'gram': 7.1e-10, 'solve': 1.4e-7, 'rotate': 0.0, 'project': 1.6e-10},
+    'block': {'overhead': 1e-2, 'gram': 6.7e-10, 'solve': 4.5e-8, 'rotate': 0.0, 'project': 1.6e-10},
+    'mixed': {'overhead': 1.5e-2, 'gram': 8.3e-10, 'solve': 1.8e-7, 'rotate': 0.0, 'project': 2.7e-10},
+    'tsqr': {'overhead': 1e-2, 'gram': 4.8e-10, 'solve': 1.2e-7, 'rotate': 0.0, 'project': 1.6e-10},
+    'packed': {'overhead': 1.9e-2, 'gram': 2.9e-10, 'solve': 2.1e-7, 'rotate': 0.0, 'project': 1.6e-10},
+    'cuda': {'overhead': 0.3, 'gram': 2e-10, 'solve': 5e-9, 'rotate': 0.0, 'project': 2e-10},
+}
+
+CALIBRATION_PATH = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'),
+                                'svd_pca', 'svd_calibration.json')
+
+
+def cuda_available():
+    # a usable CUDA context, without keeping pycuda imported on failure
+    try:
+        import pycuda.autoinit
+    except Exception:
+        return False
+    return True
+
+
+def load_coefficients(path=None):
+    # DEFAULT_COEFFICIENTS updated with the calibration file, if there is one
+    path = CALIBRATION_PATH if path is None else path
+    coefficients = dict((name, dict(c)) for name, c in DEFAULT_COEFFICIENTS.items())
+    if os.path.exists(path):
+        with open(path) as f:
+            for name, c in json.load(f)['coefficients'].items():
+                coefficients.setdefault(name, {}).update(c)
+    return coefficients
+
+
+def _terms(N, P, nnz=None, k=None):
+    nnz = float(N) * P if nnz is None else float(nnz)
+    k = P if k is None else min(k, P)
+    return np.array([1.0, nnz * P, float(P) ** 3, float(P) ** 4, nnz * k])
+
+
+def estimate(engine, N, P, coefficients, nnz=None, k=None):
+    c = coefficients[engine]
+    return float(np.dot([c.get(term, 0.0) for term in TERMS], _terms(N, P, nnz, k)))
+
+
+def _excluded(engine, D, has_device):
+    # reason the engine cannot take D, or None
+    N, P = D.shape
+    notes = ENGINES[engine][2]
+    if notes.get('device') and not has_device:
+        return "no CUDA device"
+    if notes.get('float32') and D.dtype == np.float64:
+        return "float32 only, D is float64"
+    if notes.get('dense') and (is_sparse(D) or compact_format(D) is not None or D.dtype.kind not in 'fc'):
+        return "needs a dense float D"
+    if 'max_P' in notes and P > notes['max_P']:
+        return "P = %d above %d" % (P, notes['max_P'])
+    if 'tall' in notes and N < notes['tall'] * P:
+        return "N < %d P" % notes['tall']
+    if engine == 'mixed' and D.dtype != np.float64:
+        return "float64 refinement only pays for float64 D"
+    if engine != 'mixed' and D.dtype == np.float64:
+        return "float64 D goes to the mixed engine"
+    return None
+
+
+def choose(D, coefficients=None, engines=None, has_device=None, k=None):
+    """
+    Engine for D (k leading triplets, all of them by default) and a report:
+    the model estimate (seconds) of every candidate and the reason every
+    other engine was ruled out.
+    """
+    coefficients = load_coefficients() if coefficients is None else coefficients
+    engines = list(ENGINES) if engines is None else list(engines)
+    if has_device is None:
+        has_device = 'cuda' in engines and cuda_available()
+    N, P = D.shape
+    nnz = D.nnz if is_sparse(D) else N * P
+    estimates, excluded = {}, {}
+    for engine in engines:
+        reason = _excluded(engine, D, has_device)
+        if reason is None:
+            estimates[engine] = estimate(engine, N, P, coefficients, nnz, k)
+        else:
+            excluded[engine] = reason
+    if not estimates:
+        raise ValueError("no engine can decompose this D: %r" % (excluded,))
+    best = min(estimates, key = estimates.get)
+    report = {'engine': best, 'N': N, 'P': P, 'nnz': nnz, 'k': k, 'dtype': str(D.dtype),
+              'sparse': is_sparse(D), 'estimates': estimates, 'excluded': excluded,
+              'reason': "lowest estimated time, %.3g s" % estimates[best]}
+    return best, report
+
+
+def svd(D, k=None, engine=None, full_matrices=False, explain=False, coefficients=None, **options):
+    """
+    Singular values sigma, right singular vectors U (columns) and the
+    transposed left singular vectors VT of D, as returned by the svd_pca_*
+    drivers, plus the driver time t. engine overrides the choice; k keeps
+    the k leading triplets (V_T is only formed for those); options go to
+    the engine. With explain=True
+    the report of choose() is returned as a fifth value.
+    """
+    if engine is None:
+        engine, report = choose(D, coefficients, k = k)
+    else:
+        if engine not in ENGINES:
+            raise ValueError("unknown engine %r" % (engine,))
+        report = {'engine': engine, 'reason': "requested"}
+    module, driver, _ = ENGINES[engine]
+    N, P = D.shape
+    sigma, U, VT, t = getattr(import_module(module), driver)(N, P, D, full_matrices, k = k, **options)
+    if explain:
+        return sigma, U, VT, t, report
+    return sigma, U, VT, t
+
+
+def calibrate(path=None, shapes=((256, 16), (512, 32), (2048, 32), (2048, 64), (1024, 128), (8192, 64)),
+              engines=None, repeats=2):
+    """
+    Time the engines on random float32 D of the given (N, P) shapes, for all
+    P and for P / 8 triplets, fit the cost model coefficients (non-negative,
+    relative least squares) and write them to path (CALIBRATION_PATH by
+    default). Returns the fitted coefficients.
+    """
+    has_device = cuda_available()
+    engines = [e for e in (ENGINES if engines is None else engines) if e != 'cuda' or has_device]
+    fitted = {}
+    for engine in engines:
+        module, driver, notes = ENGINES[engine]
+        run = getattr(import_module(module), driver)
+        rows, times = [], []
+        for N, P in shapes:
+            if P > notes.get('max_P', P) or N < notes.get('tall', 0) * P:
+                continue
+            D = np.random.randn(N, P).astype(np.float64 if engine == 'mixed' else np.float32)
+            for k in (P, max(1, P // 8)):
+                best = np.inf
+                for _ in range(repeats):
+                    t0 = time.time()
+                    run(N, P, D, False, k = k)
+                    best = min(best, time.time() - t0)
+                rows.append(_terms(N, P, k = k))
+                times.append(best)
+        if not rows:
+            continue
+        fitted[engine] = _fit(np.array(rows), np.array(times))
+    path = CALIBRATION_PATH if path is None else path
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as f:
+        json.dump({'coefficients': fitted, 'shapes': [list(s) for s in shapes]}, f, indent = 1)
+    return fitted
+
+
+def _fit(X, t):
+    # non-negative least squares on relative error: drop the most negative
+    # term and refit until every coefficient is >= 0
+    X = X / t[:, None]
+    keep = list(range(X.shape[1]))
+    while True:
+        c = np.linalg.lstsq(X[:, keep], np.ones(len(t)), rcond = None)[0]
+        if (c >= 0).all():
+            break
+        del keep[int(np.argmin(c))]
+    coef = np.zeros(X.shape[1])
+    coef[keep] = c
+    return dict(zip(TERMS, coef.tolist()))
+
+
+if __name__ == '__main__':
+    # engine choice and estimate against the measured time of that engine
+    np.random.seed(1)
+    print("N       P     dtype    engine   estimate(s)  measured(s)")
+    for N, P, dtype in ((256, 16, np.float32), (4096, 64, np.float32), (512, 128, np.float32),
+                        (100000, 32, np.float32), (1024, 64, np.float64)):
+        D = np.random.randn(N, P).astype(dtype)
+        t0 = time.time()
+        sigma, U, VT, t, report = svd(D, explain = True)
+        measured = time.time() - t0
+        engine = report['engine']
+        print("%-7d %-5d %-8s %-8s %-12.3f %.3f" % (N, P, np.dtype(dtype).name, engine, report['estimates'][engine], measured))
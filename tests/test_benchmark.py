@@ -0,0 +1,20 @@
+from benchmark import compare
+
+
+def result(id, engine, time=0.1, error=1e-6):
+    return dict(id = id, engine = engine, dtype = 'float32', time = time,
+                sigma_err = error, residual = error, orthogonality = error)
+
+
+def test_compare():
+    baseline = {'results': [result('a', 'cyclic'), result('a', 'block'), result('b', 'cyclic')]}
+    current = {'results': [result('a', 'cyclic', time = 0.2), result('b', 'cyclic', error = 1e-3),
+                           result('a', 'tsqr')]}
+    regressions, added = compare(current, baseline)
+    assert "a block: missing from the current run" in regressions
+    assert any(line.startswith("a cyclic: time") for line in regressions)
+    assert any(line.startswith("b cyclic: sigma_err") for line in regressions)
+    assert len(regressions) == 5
+    assert added == ["a tsqr: new, no baseline"]
+    # an identical run passes
+    assert compare(baseline, baseline) == ([], [])
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from benchmark import make_case
+from compact import (BFloat16, UNIT_ROUNDOFF, as_bfloat16, compact_format, compress,
+                     from_bfloat16, gram, project, sigma_bound, upcast)
+from packed import packed_gram, svd_pca_packed, unpack
+from svd_cyclic import svd_pca_cyclic
+from v1 import svd_pca_serial
+
+
+def test_bfloat16_round_trip():
+    X = np.random.RandomState(1).randn(1000).astype(np.float32)
+    B = compress(X, 'bfloat16')
+    assert isinstance(B, BFloat16) and B.dtype == np.uint16
+    assert np.all(np.abs(from_bfloat16(B) - X) <= UNIT_ROUNDOFF['bfloat16'] * np.abs(X))
+
+
+def test_compact_format():
+    X = np.ones((4, 3), dtype = np.float32)
+    B = compress(X, 'bfloat16')
+    assert compact_format(compress(X, 'float16')) == 'float16'
+    assert compact_format(B) == 'bfloat16'
+    # slices and transposes keep the marker, plain uint16 is integer data
+    assert compact_format(B[1:3]) == 'bfloat16'
+    assert compact_format(B.T) == 'bfloat16'
+    assert compact_format(np.asarray(B)) is None
+    assert compact_format(X.astype(np.uint16)) is None
+    assert compact_format(X) is None
+    assert compact_format(as_bfloat16(np.asarray(B))) == 'bfloat16'
+    with pytest.raises(ValueError):
+        as_bfloat16(X)
+
+
+@pytest.mark.parametrize('fmt', ['float16', 'bfloat16'])
+def test_gram_and_project_match_decoded(fmt):
+    D = make_case(1000, 16, np.float32, 1e2)[0]
+    Dc = compress(D, fmt)
+    D64 = upcast(Dc, np.float64)
+    # small tiles so the accumulation crosses tile boundaries
+    G = gram(Dc, tile_rows = 128)
+    assert G.dtype == np.float32
+    np.testing.assert_allclose(G, np.dot(D64.T, D64), rtol = 1e-6, atol = 1e-6 * np.abs(G).max())
+    U = np.linalg.qr(np.random.RandomState(2).randn(16, 16))[0].astype(np.float32)
+    np.testing.assert_allclose(project(Dc, U, tile_rows = 128), np.dot(D64, U), rtol = 1e-4, atol = 1e-5)
+
+
+@pytest.mark.parametrize('fmt', ['float16', 'bfloat16'])
+def test_sigma_within_bound_of_full_precision(fmt):
+    N, P, k = 2000, 32, 4
+    D = make_case(N, P, np.float32, 1e2)[0]
+    s_ref = np.linalg.svd(D.astype(np.float64), compute_uv = False)
+    Dc = compress(D, fmt)
+    sigma, U, VT, _ = svd_pca_cyclic(N, P, Dc, full_matrices = False)
+    # Weyl bound of the storage error plus float32 round-off of the solve
+    assert np.abs(sigma - s_ref).max() <= sigma_bound(Dc) + 1e-5 * s_ref[0]
+    # leading subspace against the full precision one
+    V_ref = np.linalg.svd(D.astype(np.float64))[2].T
+    dist = np.linalg.norm(np.dot(U[:, :k], U[:, :k].T) - np.dot(V_ref[:, :k], V_ref[:, :k].T), 2)
+    assert dist < 50 * UNIT_ROUNDOFF[fmt]
+
+
+def test_uint16_is_integer_data():
+    D = np.random.RandomState(0).randint(0, 1000, (200, 5)).astype(np.uint16)
+    sigma, U, VT, _ = svd_pca_serial(200, 5, D, full_matrices = False)
+    s_ref = np.linalg.svd(D.astype(np.float64), compute_uv = False)
+    np.testing.assert_allclose(sigma, s_ref, rtol = 1e-4)
+    np.testing.assert_allclose(np.dot(VT.T * sigma, U.T), D, atol = 1e-3 * s_ref[0])
+
+
+def compact_inputs(N, P):
+    # bfloat16, uint16 (whose integer products overflow in uint16) and
+    # scipy.sparse D, each with its float64 decoding
+    import scipy.sparse as sp
+    B = compress(make_case(N, P, np.float32, 1e2)[0], 'bfloat16')
+    I = np.random.RandomState(0).randint(0, 60000, (N, P)).astype(np.uint16)
+    S = sp.random(N, P, density = 0.05, format = 'csr', dtype = np.float32, random_state = 1)
+    return {'bfloat16': (B, upcast(B, np.float64)), 'uint16': (I, I.astype(np.float64)),
+            'sparse': (S, S.toarray().astype(np.float64))}
+
+
+@pytest.mark.parametrize('kind', ['bfloat16', 'uint16', 'sparse'])
+def test_packed_gram_decodes(kind):
+    D, D64 = compact_inputs(500, 20)[kind]
+    # blocks and tiles that do not divide P and N
+    Ap = packed_gram(D, block = 7, tile_rows = 96)
+    assert Ap.dtype == np.float32
+    G = np.dot(D64.T, D64)
+    np.testing.assert_allclose(unpack(Ap, 20), G, rtol = 1e-6, atol = 1e-6 * np.abs(G).max())
+
+
+@pytest.mark.parametrize('kind', ['bfloat16', 'uint16', 'sparse'])
+def test_packed_matches_cyclic(kind):
+    D, D64 = compact_inputs(1000, 16)[kind]
+    s_ref = np.linalg.svd(D64, compute_uv = False)
+    sigma = svd_pca_packed(1000, 16, D, full_matrices = False)[0]
+    np.testing.assert_allclose(sigma, svd_pca_cyclic(1000, 16, D, full_matrices = False)[0], rtol = 1e-4)
+    assert np.abs(sigma - s_ref).max() <= 1e-5 * s_ref[0]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from incremental import IncrementalSVD
+
+
+def low_rank(N, P, rank, noise=0.0, seed=0):
+    rng = np.random.RandomState(seed)
+    D = np.dot(rng.randn(N, rank), rng.randn(rank, P))
+    return (D + noise * rng.randn(N, P)).astype(np.float32)
+
+
+def subspace_distance(U, V):
+    return np.linalg.norm(np.dot(U, U.T) - np.dot(V, V.T), 2)
+
+
+def stream(D, batch, **kwargs):
+    inc = IncrementalSVD(**kwargs).fit(D[:batch])
+    for start in range(batch, D.shape[0], batch):
+        inc.update(D[start:start + batch])
+    return inc
+
+
+@pytest.mark.parametrize('batch', [1, 7, 25])
+def test_matches_from_scratch(batch):
+    D = low_rank(200, 10, 10, seed = batch)
+    inc = stream(D, batch, compute_vt = True)
+    _, s, vh = np.linalg.svd(D.astype(np.float64), full_matrices = False)
+    assert inc.n_samples_seen_ == 200
+    np.testing.assert_allclose(inc.sigma, s, rtol = 1e-3, atol = 1e-4 * s[0])
+    assert subspace_distance(inc.U[:, :3], vh[:3].T) < 1e-3
+    recon = np.dot(inc.VT.T * inc.sigma, inc.U.T)
+    assert np.linalg.norm(recon - D) / np.linalg.norm(D) < 1e-4
+
+
+def test_truncated_rank():
+    # rank-6 data plus noise; keeping 6 components tracks the leading
+    # subspace and singular values of the full decomposition
+    D = low_rank(400, 12, 6, noise = 0.01, seed = 1)
+    inc = stream(D, 25, n_components = 6)
+    _, s, vh = np.linalg.svd(D.astype(np.float64), full_matrices = False)
+    assert inc.U.shape == (12, 6)
+    np.testing.assert_allclose(inc.sigma, s[:6], rtol = 1e-3)
+    assert subspace_distance(inc.U, vh[:6].T) < 1e-2
+
+
+def test_single_row_update():
+    D = low_rank(30, 5, 5, seed = 2)
+    by_row = IncrementalSVD().fit(D[:10])
+    for row in D[10:]:
+        by_row.update(row)
+    by_block = IncrementalSVD().fit(D[:10]).update(D[10:])
+    assert by_row.n_samples_seen_ == 30
+    np.testing.assert_allclose(by_row.sigma, by_block.sigma, rtol = 1e-4)
+    # fitting on a single 1-D row works too
+    assert IncrementalSVD().fit(D[0]).n_samples_seen_ == 1
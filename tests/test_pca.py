@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import pca
+from pca import JacobiPCA
+
+
+def data(N=600, P=12, seed=0):
+    rng = np.random.RandomState(seed)
+    return np.dot(rng.randn(N, P) * np.logspace(0, -1, P), np.linalg.qr(rng.randn(P, P))[0])
+
+
+def test_default_solver_is_cyclic():
+    assert JacobiPCA().solver == 'cyclic'
+
+
+@pytest.mark.parametrize('solver', ['cyclic', 'serial'])
+def test_matches_numpy(solver):
+    D = data()
+    model = JacobiPCA(n_components = 4, solver = solver).fit(D)
+    X = D - D.mean(axis = 0)
+    _, s, vh = np.linalg.svd(X, full_matrices = False)
+    np.testing.assert_allclose(model.explained_variance_, s[:4] ** 2 / (len(D) - 1), rtol = 1e-4)
+    # components up to sign
+    overlap = np.abs(np.sum(model.components_ * vh[:4], axis = 1))
+    np.testing.assert_allclose(overlap, 1, atol = 1e-4)
+    Z = model.transform(D)
+    np.testing.assert_allclose(np.abs(Z), np.abs(np.dot(X, vh[:4].T)), atol = 1e-3)
+
+
+def test_partial_fit_defers_and_warm_starts(monkeypatch):
+    calls = []
+    eig = pca._eig
+
+    def counting(C, solver, warm_start=None):
+        calls.append(warm_start is not None)
+        return eig(C, solver, warm_start)
+
+    monkeypatch.setattr(pca, '_eig', counting)
+    D = data(seed = 1)
+    model = JacobiPCA(n_components = 3)
+    for start in range(0, len(D), 100):
+        model.partial_fit(D[start:start + 100])
+    assert calls == []
+    # one solve on first read, reused until the next batch
+    first = model.components_.copy()
+    model.explained_variance_
+    assert calls == [False]
+    model.partial_fit(D[:50])
+    model.transform(D[:5])
+    assert calls == [False, True]
+
+    full = JacobiPCA(n_components = 3).fit(np.vstack([D, D[:50]]))
+    np.testing.assert_allclose(model.explained_variance_, full.explained_variance_, rtol = 1e-5)
+    overlap = np.abs(np.sum(model.components_ * full.components_, axis = 1))
+    np.testing.assert_allclose(overlap, 1, atol = 1e-5)
+    assert first.shape == (3, 12)
+
+
+def test_unfitted():
+    with pytest.raises(AttributeError):
+        JacobiPCA().components_
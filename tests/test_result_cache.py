@@ -0,0 +1,70 @@
+import numpy as np
+import scipy.sparse as sp
+
+from compact import as_bfloat16
+from result_cache import ResultCache, cached_svd, result_key
+from svd_cyclic import svd_pca_cyclic
+
+
+def test_hit_on_equal_content():
+    rng = np.random.RandomState(0)
+    D = rng.randn(50, 6).astype(np.float32)
+    cache = ResultCache()
+    first = cached_svd(D, cache = cache, full_matrices = False)
+    second = cached_svd(D.copy(), cache = cache, full_matrices = False)
+    assert second is first and cache.stats()['hits'] == 1
+    # non-contiguous views hash by content too
+    assert result_key(np.asfortranarray(D)) == result_key(D)
+    assert result_key(D, full_matrices = True) != result_key(D, full_matrices = False)
+
+
+def test_array_options_hashed_by_content():
+    # two 40 x 40 bases that differ only away from the corners, which is
+    # all the abbreviated repr of a 1600 entry array shows
+    rng = np.random.RandomState(1)
+    D = rng.randn(200, 40).astype(np.float32)
+    Q1 = np.eye(40, dtype = np.float32)
+    Q2 = Q1.copy()
+    Q2[10:12, 10:12] = [[0.6, -0.8], [0.8, 0.6]]
+    assert repr(Q1) == repr(Q2)
+    cache = ResultCache()
+    a = cached_svd(D, svd_pca_cyclic, cache, full_matrices = False, warm_start = Q1)
+    b = cached_svd(D, svd_pca_cyclic, cache, full_matrices = False, warm_start = Q2)
+    assert b is not a and cache.stats()['hits'] == 0
+    assert cached_svd(D, svd_pca_cyclic, cache, full_matrices = False, warm_start = Q2.copy()) is b
+
+
+def test_sparse_keys():
+    D = sp.random(100, 20, density = 0.1, format = 'csr', random_state = 2, dtype = np.float32)
+    assert result_key(D) == result_key(D.copy())
+    assert result_key(D) == result_key(D.tocoo())
+    E = D.copy()
+    E.data[0] += 1
+    assert result_key(D) != result_key(E)
+    assert result_key(D) != result_key(D.tocsc())
+    cache = ResultCache()
+    first = cached_svd(D, svd_pca_cyclic, cache, full_matrices = False)
+    assert cached_svd(D.copy(), svd_pca_cyclic, cache, full_matrices = False) is first
+
+
+def test_bfloat16_differs_from_uint16():
+    bits = np.arange(12, dtype = np.uint16).reshape(4, 3)
+    assert result_key(bits) != result_key(as_bfloat16(bits))
+
+
+def test_disk_hits_promoted(tmp_path):
+    D = np.random.RandomState(3).randn(60, 8).astype(np.float32)
+    first = cached_svd(D, svd_pca_cyclic, ResultCache(disk_dir = str(tmp_path)), full_matrices = False)
+    # a fresh cache over the same directory: the first lookup reads the
+    # files, the second is a memory hit on the promoted entry
+    cache = ResultCache(disk_dir = str(tmp_path))
+    second = cached_svd(D, svd_pca_cyclic, cache, full_matrices = False)
+    assert cache.stats()['disk_hits'] == 1 and len(cache) == 1
+    for x, y in zip(first, second):
+        np.testing.assert_array_equal(x, y)
+    assert cached_svd(D, svd_pca_cyclic, cache, full_matrices = False) is second
+    assert cache.stats()['hits'] == 1 and cache.stats()['disk_hits'] == 1
+    # a memory tier too small for the entry keeps it on disk only
+    small = ResultCache(max_bytes = 16, disk_dir = str(tmp_path))
+    cached_svd(D, svd_pca_cyclic, small, full_matrices = False)
+    assert len(small) == 0 and small.stats()['bytes'] == 0
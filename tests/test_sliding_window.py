@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from covariance import CovarianceStats
+from sliding_window import SlidingWindowPCA
+
+
+def window_reference(rows, W):
+    # eigenvalues and leading subspace of the batch covariance of the last
+    # W rows, from the SVD of the centered window
+    X = rows[-W:] - rows[-W:].mean(axis = 0)
+    _, s, vh = np.linalg.svd(X, full_matrices = False)
+    return s ** 2 / (len(X) - 1), vh
+
+
+def test_remove_inverts_merge():
+    rng = np.random.RandomState(0)
+    A, B = rng.randn(40, 6) + 1e6, rng.randn(25, 6) + 1e6
+    stats = CovarianceStats.from_chunk(np.vstack([A, B])).remove(CovarianceStats.from_chunk(B))
+    ref = CovarianceStats.from_chunk(A)
+    assert stats.n == 40
+    np.testing.assert_allclose(stats.mean, ref.mean, rtol = 1e-15)
+    np.testing.assert_allclose(stats.M2, ref.M2, atol = 1e-6 * np.abs(ref.M2).max())
+    assert CovarianceStats.from_chunk(A).remove(CovarianceStats.from_chunk(A)).n == 0
+
+
+@pytest.mark.parametrize('offset', [0.0, 1e6])
+def test_window_matches_batch_svd(offset):
+    # ticks of varying size, including one larger than the window; the
+    # statistics go through thousands of add / evict updates between
+    # refreshes, and a large mean must not cancel the variance
+    rng = np.random.RandomState(1)
+    P, W = 8, 60
+    scales = np.linspace(3, 0.5, P)
+    swpca = SlidingWindowPCA(W, n_components = 3, refresh_every = 10 ** 6)
+    rows = []
+    for b in [1, 7, 3, 75, 2] * 40:
+        X = rng.randn(b, P) * scales + offset
+        rows.append(X)
+        swpca.push(X)
+    rows = np.vstack(rows)
+    e, vh = window_reference(rows, W)
+    np.testing.assert_allclose(swpca.mean_, rows[-W:].mean(axis = 0), rtol = 1e-12, atol = 1e-12)
+    np.testing.assert_allclose(swpca.explained_variance_, e[:3], rtol = 1e-8)
+    V = swpca.components_
+    assert np.linalg.norm(np.dot(V.T, V) - np.dot(vh[:3].T, vh[:3]), 2) < 1e-6
+    np.testing.assert_allclose(swpca.explained_variance_ratio_, e[:3] / e.sum(), rtol = 1e-8)
+
+
+def test_partial_window_and_features():
+    swpca = SlidingWindowPCA(50)
+    X = np.random.RandomState(2).randn(10, 4)
+    swpca.push(X[:6]).push(X[6])
+    e, _ = window_reference(X[:7], 50)
+    np.testing.assert_allclose(swpca.explained_variance_, e, rtol = 1e-8, atol = 1e-12)
+    with pytest.raises(ValueError):
+        swpca.push(np.ones((2, 5)))
+
+
+def test_latency_stats():
+    swpca = SlidingWindowPCA(20, history = 5)
+    assert swpca.latency_stats() == {}
+    for X in np.random.RandomState(3).randn(8, 3, 4):
+        swpca.push(X)
+    stats = swpca.latency_stats()
+    assert stats['ticks'] == 8 and len(swpca.latencies) == 5
+    assert 0 < stats['p50'] <= stats['p95'] <= stats['p99'] <= stats['max']
+    assert stats['mean_sweeps'] >= 1
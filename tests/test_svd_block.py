@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from svd_block import batched_jacobi, block_jacobi
+
+
+def covariance(P, seed=0, dtype=np.float32):
+    X = np.random.RandomState(seed).randn(2 * P, P)
+    return np.dot(X.T, X).astype(dtype)
+
+
+def test_batched_jacobi_diagonalizes_stack():
+    S = np.stack([covariance(12, seed) for seed in range(3)])
+    S0 = S.copy()
+    Q, rotated = batched_jacobi(S, np.finfo(np.float32).eps, max_sweeps = 30)
+    assert rotated.all()
+    for i in range(3):
+        off = S[i] - np.diag(np.diag(S[i]))
+        assert np.abs(off).max() < 1e-5 * np.abs(S[i]).max()
+        np.testing.assert_allclose(np.dot(Q[i] * np.diag(S[i]), Q[i].T), S0[i], atol = 1e-4 * np.abs(S0[i]).max())
+    # an already diagonal matrix is left alone
+    Q, rotated = batched_jacobi(np.diag(np.arange(1.0, 5.0))[None], 1e-7)
+    assert not rotated.any() and np.array_equal(Q[0], np.eye(4))
+
+
+# P = 100 with 16 wide blocks pads to 8 blocks, P = 90 to an odd count
+@pytest.mark.parametrize('P, block', [(64, 16), (100, 16), (90, 32), (40, 64)])
+def test_matches_eigvalsh(P, block):
+    C = covariance(P, P)
+    stats = {}
+    e, E, sweeps = block_jacobi(C, block = block, stats = stats)
+    ref = np.linalg.eigvalsh(C.astype(np.float64))
+    assert e.shape == (P,) and E.shape == (P, P)
+    assert np.abs(np.sort(e) - ref).max() < 1e-5 * ref[-1]
+    assert np.abs(np.dot(E.T, E) - np.eye(P)).max() < 1e-5
+    assert np.abs(np.dot(C, E) - E * e).max() < 1e-5 * ref[-1]
+
+
+def test_float64():
+    C = covariance(80, 1, np.float64)
+    e, E, _ = block_jacobi(C, block = 16)
+    ref = np.linalg.eigvalsh(C)
+    assert np.abs(np.sort(e) - ref).max() < 1e-12 * ref[-1]
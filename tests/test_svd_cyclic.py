@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from svd_cyclic import cyclic_jacobi
+
+
+def drifting(P, seed):
+    # nearly diagonal matrix whose indices converge at different sweeps, so
+    # a deflated solve rebuilds its schedule more than once
+    rng = np.random.RandomState(seed)
+    d = np.sort(rng.rand(P)) * 10
+    scale = np.logspace(0, -6, P)[rng.permutation(P)]
+    X = rng.randn(P, P) * np.sqrt(np.outer(scale, scale))
+    return (np.diag(d) + X + X.T).astype(np.float32)
+
+
+@pytest.mark.parametrize('deflate', [False, True])
+def test_resume_is_bit_identical(tmp_path, deflate):
+    path = str(tmp_path / 'snap.npy')
+    for seed in (20, 21, 24):
+        A = drifting(48, seed)
+        e0, E0, n0 = cyclic_jacobi(A, tol = 1e-3, deflate = deflate)
+        for stop in range(1, n0):
+            cyclic_jacobi(A, tol = 1e-3, deflate = deflate, checkpoint = path, max_sweeps = stop)
+            e1, E1, n1 = cyclic_jacobi(A, tol = 1e-3, deflate = deflate, resume_from = path)
+            assert n1 == n0
+            assert np.array_equal(e1, e0) and np.array_equal(E1, E0)
+
+
+def test_deflate_matches_full_solve():
+    A = drifting(48, 3)
+    e0, E0, _ = cyclic_jacobi(A)
+    stats = {}
+    e1, E1, _ = cyclic_jacobi(A, deflate = True, stats = stats)
+    assert min(stats['active']) < 48
+    np.testing.assert_allclose(np.sort(e1), np.sort(e0), rtol = 1e-6, atol = 1e-6 * np.abs(e0).max())
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+import svd_dispatch
+from svd_dispatch import DEFAULT_COEFFICIENTS, choose, estimate, svd
+
+
+def test_estimate_uses_nnz_and_k():
+    dense = estimate('cyclic', 20000, 64, DEFAULT_COEFFICIENTS)
+    sparse = estimate('cyclic', 20000, 64, DEFAULT_COEFFICIENTS, nnz = 20000 * 64 // 100)
+    leading = estimate('cyclic', 20000, 64, DEFAULT_COEFFICIENTS, k = 4)
+    assert sparse < dense and leading < dense
+    # k above P is the full projection
+    assert estimate('cyclic', 20000, 64, DEFAULT_COEFFICIENTS, k = 500) == dense
+
+
+def test_choose_reports_nnz():
+    S = sp.random(5000, 32, density = 0.01, format = 'csr', dtype = np.float32, random_state = 0)
+    _, report = choose(S, engines = ['cyclic', 'block'], has_device = False, k = 3)
+    assert report['nnz'] == S.nnz and report['k'] == 3
+    _, dense = choose(S.toarray(), engines = ['cyclic', 'block'], has_device = False)
+    assert report['estimates']['cyclic'] < dense['estimates']['cyclic']
+
+
+@pytest.mark.parametrize('dtype', [np.uint16, np.int32])
+def test_packed_needs_float_d(dtype):
+    D = np.random.RandomState(0).randint(0, 1000, (2000, 16)).astype(dtype)
+    engine, report = choose(D, engines = ['packed', 'cyclic'], has_device = False)
+    assert engine == 'cyclic' and 'packed' in report['excluded']
+    sigma = svd(D, k = 3)[0]
+    np.testing.assert_allclose(sigma, np.linalg.svd(D.astype(np.float64), compute_uv = False)[:3], rtol = 1e-5)
+
+
+@pytest.mark.parametrize('engine', ['serial', 'cyclic', 'block', 'packed', 'tsqr'])
+def test_leading_triplets(engine):
+    rng = np.random.RandomState(1)
+    D = (rng.randn(400, 16) * np.linspace(4, 1, 16)).astype(np.float32)
+    sigma, U, VT, _ = svd(D, k = 3, engine = engine)
+    assert sigma.shape == (3,) and U.shape == (16, 3) and VT.shape == (3, 400)
+    ref = np.linalg.svd(D.astype(np.float64), compute_uv = False)
+    np.testing.assert_allclose(sigma, ref[:3], rtol = 1e-4)
+    np.testing.assert_allclose(np.dot(U * sigma, VT), np.dot(np.dot(D.T, VT.T), VT), atol = 1e-3)
+
+
+def test_calibration_outside_source_tree():
+    source = os.path.dirname(os.path.abspath(svd_dispatch.__file__))
+    assert not os.path.abspath(svd_dispatch.CALIBRATION_PATH).startswith(source + os.sep)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from benchmark import make_case
+from svd_cyclic import cyclic_jacobi
+from tsqr import apply_q, one_sided_jacobi, svd_pca_tsqr, tsqr
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_tsqr_r_factor(n_jobs):
+    D = make_case(1000, 12, cond = 1e2)[0]
+    R, tree = tsqr(D, chunk_rows = 96, n_jobs = n_jobs, keep_q = True)
+    assert R.shape == (12, 12)
+    np.testing.assert_allclose(np.dot(R.T, R), np.dot(D.T, D), atol = 1e-12)
+    # the implicit Q reproduces D
+    np.testing.assert_allclose(apply_q(tree, R), D, atol = 1e-12)
+
+
+def test_one_sided_jacobi():
+    D, s, _ = make_case(300, 20, cond = 1e4)
+    R = np.linalg.qr(D, mode = 'r')
+    stats = {}
+    e, V, sweeps = one_sided_jacobi(R, stats = stats)
+    assert sweeps > 0 and stats['rotations'] > 0
+    np.testing.assert_allclose(np.sort(np.sqrt(e))[::-1], s, rtol = 1e-10)
+    np.testing.assert_allclose(np.dot(V.T, V), np.eye(20), atol = 1e-13)
+
+
+@pytest.mark.parametrize('keep_q', [False, True])
+def test_more_accurate_than_gram_path(keep_q):
+    # cond 1e6: the Gram path loses the small singular values in float32
+    N, P = 2000, 24
+    D64, s, _ = make_case(N, P, cond = 1e6, seed = 1)
+    D = D64.astype(np.float32)
+    sigma, U, VT, _ = svd_pca_tsqr(N, P, D, full_matrices = False, chunk_rows = 256, keep_q = keep_q)
+    gram_sigma = svd_pca_tsqr(N, P, D, full_matrices = False, solver = cyclic_jacobi)[0]
+    err = np.abs(sigma - s).max() / s[0]
+    assert err < 1e-5
+    assert np.abs(gram_sigma - s).max() / s[0] > 10 * err
+    assert np.abs(np.dot(U.T, U) - np.eye(P)).max() < 1e-5
+    # leading left singular vectors reconstruct D
+    k = 8
+    approx = np.dot(VT[:k].T * sigma[:k], U[:, :k].T)
+    assert np.linalg.norm(approx - D64) / np.linalg.norm(D64) < 1e-2
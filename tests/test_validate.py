@@ -0,0 +1,37 @@
+import numpy as np
+
+from benchmark import make_case
+from svd_components import svd_pca_components
+from validate import scores, settings
+
+
+def test_exact_factors_score_zero():
+    D, s, Q2 = make_case(200, 12, cond = 1e3)
+    # computed vectors in a different order than the true ones
+    order = np.random.RandomState(0).permutation(12)
+    sigma, U = s[order], -Q2[:, order]
+    VT = np.dot(D, U).T / sigma[:, None]
+    result = scores(D, s, Q2, sigma, U, VT)
+    assert result['vector_err'] < 1e-12
+    assert result['subspace_err'] < 1e-12
+
+
+def test_vector_matching_is_one_to_one():
+    # both true vectors overlap most with the first computed one; a per-row
+    # argmax would match both to it and report an error below 1
+    s = np.array([1.0, 0.5, 0.0])
+    Q2 = np.eye(3)
+    u1 = np.array([0.3, 0.2, 0.93])
+    U = np.column_stack([[0.75, 0.66, 0.0], u1 / np.linalg.norm(u1), [0.0, 0.0, 1.0]])
+    result = scores(np.diag(s), s, Q2, s, U, np.eye(3))
+    assert result['vector_err'] > 1
+
+
+def test_components_on_block_diagonal():
+    D, s, Q2 = make_case(256, 24, cond = 1e3, blocks = 4)
+    stats = {}
+    sigma, U, VT, _ = svd_pca_components(256, 24, D.astype(np.float32), False, stats = stats)
+    assert stats['blocks'] == [6, 6, 6, 6]
+    result = scores(D, s, Q2, sigma, U, VT)
+    assert result['sigma_err'] < 1e-5 and result['vector_err'] < 1e-3
+    assert 'components' in [label for label, _, _ in settings()]
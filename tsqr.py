@@ -0,0 +1,194 @@
+"""
+Tall-skinny QR (TSQR) front end for N >> P.
+
+D is cut into row chunks, each chunk is reduced to its R factor with a
+Householder QR (np.linalg.qr), and the R factors are stacked in pairs and
+reduced again up a binary tree until one P x P R is left, with
+D_T D = R_T R. Only one chunk and the R factors of a tree level are held
+at a time, so memory stays O(chunk_rows P + N/chunk_rows P^2); the leaf
+QRs, which carry almost all of the flops, run on a thread pool (LAPACK
+releases the GIL). The Jacobi solve then only touches P x P data.
+
+R_T R is never formed either: one_sided_jacobi orthogonalizes the
+columns of R directly (Hestenes), so the condition number is not
+squared and small singular values keep about cond(D) eps accuracy
+relative to sigma_1, where the Gram path loses them below
+sqrt(eps) sigma_1.
+
+The N-side factor VT is either projected from D in a second streaming
+pass (default) or, with keep_q=True, rebuilt from the stored Q factors of
+the tree, which avoids re-reading D at O(N P) memory for the Q factors.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Helper import s_driver
+from compact import compact_format, upcast
+from sparse_input import is_sparse
+from svd_cyclic import chess_schedule, jacobi_params
+
+
+def _leaf(D, start, chunk_rows, dtype, keep_q):
+    X = D[start:start + chunk_rows]
+    X = X.toarray().astype(dtype) if is_sparse(X) else upcast(X, dtype)
+    if keep_q:
+        return np.linalg.qr(X)
+    return None, np.linalg.qr(X, mode = 'r')
+
+
+def tsqr(D, chunk_rows=4096, n_jobs=1, keep_q=False):
+    """
+    R factor of D (min(N, P) x P, D_T D = R_T R) by a binary tree of QRs of
+    row chunks; n_jobs > 1 computes the leaf QRs on a thread pool.
+
+    Returns R and the Q factors of the tree (levels of (Q, split) nodes,
+    see apply_q) if keep_q, else None.
+    """
+    N, P = D.shape
+    dtype = np.float32 if compact_format(D) is not None else np.result_type(D.dtype, np.float32)
+    starts = range(0, N, chunk_rows)
+    leaf = lambda start: _leaf(D, start, chunk_rows, dtype, keep_q)
+    if n_jobs is not None and n_jobs > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers = n_jobs) as pool:
+            leaves = list(pool.map(leaf, starts))
+    else:
+        leaves = [leaf(start) for start in starts]
+
+    Rs = [R for _, R in leaves]
+    tree = [[(Q, None) for Q, _ in leaves]] if keep_q else None
+    while len(Rs) > 1:
+        # QR of the stacked pairs; an odd one out moves up unchanged
+        level, merged = [], []
+        for i in range(0, len(Rs) - 1, 2):
+            X = np.vstack([Rs[i], Rs[i + 1]])
+            if keep_q:
+                Q, R = np.linalg.qr(X)
+                level.append((Q, Rs[i].shape[0]))
+            else:
+                R = np.linalg.qr(X, mode = 'r')
+            merged.append(R)
+        if len(Rs) % 2:
+            merged.append(Rs[-1])
+            level.append((None, None))
+        Rs = merged
+        if keep_q:
+            tree.append(level)
+    return Rs[0], tree
+
+
+def apply_q(tree, Y):
+    # Q Y for the implicit N x min(N, P) Q of tsqr, from the root down
+    blocks = [Y]
+    for level in reversed(tree):
+        out = []
+        for (Q, split), B in zip(level, blocks):
+            if Q is None:
+                out.append(B)
+            elif split is None:
+                out.append(np.dot(Q, B))
+            else:
+                X = np.dot(Q, B)
+                out.extend([X[:split], X[split:]])
+        blocks = out
+    return np.vstack(blocks)
+
+
+def one_sided_jacobi(R, tol=None, max_sweeps=30, stats=None):
+    """
+    One-sided (Hestenes) Jacobi on the columns of R: the chess rounds of
+    cyclic_jacobi rotate column pairs (k, l) until every pair is
+    orthogonal, |w_k . w_l| <= tol ||w_k|| ||w_l|| (tol defaults to
+    sqrt(rows) times the machine epsilon of R's dtype), giving R V = W with
+    orthogonal columns. The rotation of a pair is the one cyclic_jacobi
+    would apply to R_T R, but the inner products are taken from the
+    current columns, so R_T R is never formed. If a dict is passed as
+    stats, the rotations applied are added to stats['rotations'].
+
+    Returns e (the squared column norms of W, i.e. the eigenvalues of
+    R_T R), V (as columns, unsorted) and the number of sweeps that
+    applied at least one rotation.
+    """
+    dtype = np.result_type(R.dtype, np.float32)
+    W = np.array(R, dtype = dtype)
+    m, P = W.shape
+    if tol is None:
+        tol = np.sqrt(max(m, 1)) * np.finfo(dtype).eps
+    if stats is not None:
+        stats.setdefault('rotations', 0)
+    V = np.eye(P, dtype = dtype)
+    schedule = chess_schedule(P)
+    sweeps = 0
+    while sweeps < max_sweeps:
+        rotated = False
+        for pairs in schedule:
+            k, l = pairs[:, 0], pairs[:, 1]
+            Wk, Wl = W[:, k], W[:, l]
+            alpha = np.einsum('ij,ij->j', Wk, Wk)
+            beta = np.einsum('ij,ij->j', Wl, Wl)
+            gamma = np.einsum('ij,ij->j', Wk, Wl)
+            active = np.abs(gamma) > tol * np.sqrt(alpha * beta)
+            if not active.any():
+                continue
+            k, l = k[active], l[active]
+            c, s = jacobi_params(alpha[active], beta[active], gamma[active])
+            Wk, Wl = Wk[:, active], Wl[:, active]
+            W[:, k] = Wk * c - Wl * s
+            W[:, l] = Wk * s + Wl * c
+            Vk, Vl = V[:, k], V[:, l]
+            V[:, k] = Vk * c - Vl * s
+            V[:, l] = Vk * s + Vl * c
+            rotated = True
+            if stats is not None:
+                stats['rotations'] += len(k)
+        if not rotated:
+            break
+        sweeps += 1
+    return np.einsum('ij,ij->j', W, W), V, sweeps
+
+
+def svd_pca_tsqr(N, P, D, full_matrices=True, chunk_rows=4096, n_jobs=1, keep_q=False,
+                 solver=None, **options):
+    # Helper.s_driver on R instead of D_T D: neither D_T D nor R_T R is
+    # formed, one_sided_jacobi (options go to it) works on R. A Gram solver
+    # such as cyclic_jacobi can be passed as solver; it then runs on R_T R
+    # and gives the accuracy of the Gram path
+    R, tree = tsqr(D, chunk_rows, n_jobs, keep_q)
+    if solver is None:
+        solve = one_sided_jacobi
+    else:
+        solve = lambda R, **options: solver(np.dot(R.T, R), **options)
+    if not keep_q:
+        return s_driver(solve, D, full_matrices, covariance = lambda D: R, **options)
+    # left singular vectors of R, mapped through the Q factors
+    t0 = time.time()
+    sigma, U, VT, _ = s_driver(solve, R, False, covariance = lambda R: R, **options)
+    VT = apply_q(tree, VT.T).T
+    if full_matrices:
+        VT_full = np.zeros((N, N), dtype = VT.dtype)
+        VT_full[:len(VT)] = VT
+        VT = VT_full
+    t1 = time.time()
+    return sigma, U, VT, t1-t0
+
+if __name__ == '__main__':
+    # TSQR front end against the Gram matrix path for tall, graded D (cond
+    # about 1e5): time and singular value agreement with LAPACK
+    from svd_cyclic import svd_pca_cyclic
+    np.random.seed(1)
+    print("N        P    gram(s)  tsqr(s)  tsqr+q(s)  gram err  tsqr err")
+    for N, P in ((50000, 32), (200000, 64)):
+        D = np.dot(np.random.randn(N, P) * np.logspace(0, -5, P), np.linalg.qr(np.random.randn(P, P))[0])
+        D = D.astype(np.float32)
+        ref = np.linalg.svd(D.astype(np.float64), compute_uv = False)
+        times, errs = [], []
+        for run in (lambda: svd_pca_cyclic(N, P, D, full_matrices = False),
+                    lambda: svd_pca_tsqr(N, P, D, full_matrices = False),
+                    lambda: svd_pca_tsqr(N, P, D, full_matrices = False, keep_q = True)):
+            t0 = time.time()
+            s, U, VT, _ = run()
+            times.append(time.time() - t0)
+            errs.append(np.abs(s - ref).max() / ref[0])
+        print("%-8d %-4d %-8.2f %-8.2f %-10.2f %-9.1e %.1e" % (N, P, times[0], times[1], times[2], errs[0], errs[1]))
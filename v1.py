@@ -7,46 +7,93 @@ Created on Tue Dec  3 14:10:24 2019
 import time
 import numpy as np
 import random
-import matplotlib.pyplot as plt
-from Helper import s_maxind, s_update, s_rotate            
+from Helper import s_maxind, s_update, s_rotate, s_rotate_vec, s_driver, PivotTree, RotationLog
+from checkpoint import load_snapshot, save_snapshot
+from compact import compact_format
+from memory import plan
+from sparse_input import is_sparse
+from profiling import current
 
-def svd_pca_serial(N, P, D):
+def jacobi_serial(As, warm_start=None, checkpoint=None, checkpoint_every=1, resume_from=None,
+                  pivot='scan', defer_vectors=None):
+    #classical Jacobi eigenvalue iteration on the symmetric matrix As.
+    #As is rotated in place; returns eigenvalues e, eigenvectors E (as
+    #columns, unsorted) and the number of rotations applied.
+    #warm_start=U_prev starts from a previous eigenbasis: As is rotated to
+    #U_prev_T As U_prev and the rotations are composed onto U_prev.
+    #checkpoint=path snapshots the solver state every checkpoint_every
+    #sweeps (P(P-1)/2 rotations each); resume_from=path continues from such
+    #a snapshot with bit-identical results.
+    #pivot='scan' is the original search over the cached row maxima ind;
+    #pivot='tree' keeps exact row maxima in a PivotTree (O(log P) global
+    #pivot, repaired after every rotation) and rotates with NumPy slices.
+    #defer_vectors=w logs the rotations in a RotationLog and applies them to
+    #E in GEMMs over at most w columns instead of rotating E every step
+    P = As.shape[0]
     MAX_ITER = 1000000
-    state = P
-    num_iter = 0
     
-    #initializing eigenvector matrix to diag{1xP}
-    E = np.diag(np.ones((P), dtype = np.float32))
-    U = np.empty((P,P), dtype = np.float32)
-    
-    #calculating covariance matrix
-    DT = D.T
-    As = np.dot(DT,D)
-    
-    #initializing some useful variables
-    ind = np.empty((P),dtype = np.int32)
-    e = np.empty((P), dtype = np.float32)
-    changed = np.zeros((P), dtype = np.bool)
-    
-    #setting ind to index of maximum value in each column and setting 
-    #eigenvalues to diagonal elements of covariance matrix
-    for i in range(P):  
-        ind[i] = s_maxind(As,P,i)
-        e[i] = As[i][i]
-        changed[i] = True
-    t0 = time.time()
+    if resume_from is not None:
+        snap = load_snapshot(resume_from)
+        As[...] = snap['As']
+        E, e, ind, changed = snap['E'], snap['e'], snap['ind'], snap['changed']
+        state, num_iter = int(snap['state']), int(snap['num_iter'])
+    else:
+        state = P
+        num_iter = 0
+        
+        #initializing eigenvector matrix to diag{1xP}, or to the previous
+        #eigenbasis when warm starting
+        if warm_start is None:
+            E = np.diag(np.ones((P), dtype = np.float32))
+        else:
+            E = np.array(warm_start, dtype = np.float32)
+            As[...] = np.dot(np.dot(E.T, As), E)
+        
+        #initializing some useful variables
+        ind = np.empty((P),dtype = np.int32)
+        e = np.empty((P), dtype = np.float32)
+        changed = np.zeros((P), dtype = bool)
+        
+        #setting ind to index of maximum value in each column and setting 
+        #eigenvalues to diagonal elements of covariance matrix
+        for i in range(P):  
+            ind[i] = s_maxind(As,P,i)
+            e[i] = As[i][i]
+            changed[i] = True
+    snapshot_every = checkpoint_every * max(P*(P-1)//2, 1)
+    if pivot == 'tree':
+        tree = PivotTree(As)
+    elif pivot != 'scan':
+        raise ValueError("unknown pivot search %r" % (pivot,))
+    log = None if defer_vectors is None else RotationLog(defer_vectors)
+    #one 'sweep' record per P(P-1)/2 rotations when profiling.profiled() is
+    #active; a rotation updates two rows of the upper triangle and two
+    #columns of E, about 12P flops and 8P words
+    prof = current()
+    sweep_len = max(P*(P-1)//2, 1)
+    t_sweep, swept = time.perf_counter(), num_iter
+    def record_sweep():
+        n = num_iter - swept
+        prof.add('sweep', time.perf_counter() - t_sweep, 12.0*P*n, 8.0*P*n*As.itemsize, rotations=n)
+        return time.perf_counter(), num_iter
     #start iteration of jaboi method
     
     while (state>0 and num_iter<MAX_ITER):
-        m=0
-        #find index of maximum element in each column
-        for i in range(1,P-1):
-            if(abs(As[i][ind[i]])>abs(As[m][ind[m]])):
-                m = i
+        if pivot == 'tree':
+            #largest off-diagonal element straight from the tree root
+            k, l = tree.pivot()
+            if As[k][l] == 0:
+                break
+        else:
+            m=0
+            #find index of maximum element in each column
+            for i in range(1,P-1):
+                if(abs(As[i][ind[i]])>abs(As[m][ind[m]])):
+                    m = i
+            k = m
+            l = ind[k]
         
         #calculate sine, cosine values for rotation and tolerance for stopsign
-        k = m
-        l = ind[k]
         p = As[k][l]
         y = 0.5 * (e[l]-e[k])
         d = abs(y) + np.sqrt(p*p + y*y)
@@ -62,6 +109,26 @@ def svd_pca_serial(N, P, D):
         #update state of eigenvalues if their values have been changed
         changed1, state1 = s_update(k, -t, e, changed, state)
         changed, state= s_update(l, t, e, changed1, state1)
+        if pivot == 'tree':
+            #same rotations as below, as whole-slice NumPy updates
+            s_rotate_vec(As,k,l,c,s)
+            if log is not None:
+                log.add(E,k,l,c,s)
+            else:
+                Ek, El = E[:, k].copy(), E[:, l].copy()
+                E[:, k] = c * Ek - s * El
+                E[:, l] = s * Ek + c * El
+            tree.repair(As, k, l)
+            num_iter += 1
+            if prof is not None and num_iter % sweep_len == 0:
+                t_sweep, swept = record_sweep()
+            if checkpoint is not None and num_iter % snapshot_every == 0:
+                if log is not None:
+                    log.flush(E)
+                save_snapshot(checkpoint, As=As, E=E, e=e, ind=ind, changed=changed,
+                              state=state, num_iter=num_iter)
+            continue
+        
         #rotate covariance matrix on offdiagonal elements to reduce it to 
         #eigenvalue matrix
         for i in range(0,k):
@@ -72,48 +139,52 @@ def svd_pca_serial(N, P, D):
             As = s_rotate(k,z,l,z,As,c,s)
         
         #rotate eigenvectors
-        for i in range(0,P):
-            ik = c * E[i][k] - s * E[i][l]
-            il = s * E[i][k] + c * E[i][l]
-            E[i][k] = ik
-            E[i][l] = il
+        if log is not None:
+            log.add(E,k,l,c,s)
+        else:
+            for i in range(0,P):
+                ik = c * E[i][k] - s * E[i][l]
+                il = s * E[i][k] + c * E[i][l]
+                E[i][k] = ik
+                E[i][l] = il
         
         ind[k] = s_maxind(As,P,k)
         ind[l] = s_maxind(As,P,l)
         
         num_iter += 1
+        if prof is not None and num_iter % sweep_len == 0:
+            t_sweep, swept = record_sweep()
+        if checkpoint is not None and num_iter % snapshot_every == 0:
+            if log is not None:
+                log.flush(E)
+            save_snapshot(checkpoint, As=As, E=E, e=e, ind=ind, changed=changed,
+                          state=state, num_iter=num_iter)
         
-    sum_eigenvalues = 0.0
-    sigma = np.empty((P),dtype = np.float32)
-    
-    #sort eigenvalues in descending order along with corresponding indices
-    e = np.sort(e)
-    newind = np.argsort(e)
-    e = np.flip(e)
-    newind = np.flip(newind)
-    
-    #calculate singular values of D
-    for i in range(P):
-        sigma[i] = np.sqrt(e[i])
-        sum_eigenvalues += e[i]
-    
-    #calculate eigenvector U of D
-    for i in range(P):
-        for j in range(P):
-            U[i][j] = E[i][newind[j]]
+    if log is not None:
+        log.flush(E)
+    if prof is not None and num_iter > swept:
+        record_sweep()
+    return e, E, num_iter
+
+def svd_pca_serial(N, P, D, full_matrices=True, memory_budget=None, **options):
+    #full_matrices=False returns the economy factors: U (PxP), sigma (P)
+    #and VT (PxN) instead of the zero padded (NxN) VT; the remaining options
+    #(warm_start, checkpoint, resume_from, ...) are passed on to jacobi_serial
+    #memory_budget=bytes plans the run with memory.plan before any work:
+    #the padded VT is dropped (full_matrices=False) and the tiles of
+    #compact / sparse D shrink to fit, otherwise MemoryError is raised
+    tile_rows = 4096
+    if memory_budget is not None:
+        settings = plan(N, P, memory_budget, 4, full_matrices,
+                        tiled = compact_format(D) is not None or is_sparse(D))
+        full_matrices, tile_rows = settings['full_matrices'], settings['tile_rows']
     
-    #calculating eigenvector VT of D        
-    inv_sigma = np.zeros((N,P),dtype = np.float32)
-    for i in range(P):
-        inv_sigma[i][i] = 1.0/sigma[i]
-    UT = U.T
-    prod = np.dot(inv_sigma,UT)
-    VT = np.dot(prod, DT)
-    t1 = time.time()
-    #return calculated eigenvalue and eigenvector matrices
-    return sigma, U, VT, t1-t0
+    #covariance matrix (compact D is upcast tile by tile), jacobi_serial and
+    #the vectorized sort / VT pass of Helper.s_postprocess
+    return s_driver(jacobi_serial, D, full_matrices, tile_rows=tile_rows, **options)
 
 if __name__ =='__main__':
+    import matplotlib.pyplot as plt
     random.seed(1)
     t = []
     for i in range(1,15):
@@ -144,6 +215,25 @@ if __name__ =='__main__':
     plt.legend()
     plt.savefig('final.png')  
     
+    #pivot search comparison: original scan, tournament tree and the host
+    #cyclic ordering on the same covariance matrices, and the scan with the
+    #eigenvector updates deferred to 64 column GEMMs
+    from svd_cyclic import cyclic_jacobi
+    print("P     scan(s)   tree(s)   cyclic(s) deferred(s)")
+    for P in (32, 64, 96):
+        A = np.random.randn(2*P,P).astype(np.float32)
+        A1 = np.dot(A.T,A)
+        t0 = time.time()
+        jacobi_serial(A1.copy(), pivot='scan')
+        t1 = time.time()
+        jacobi_serial(A1.copy(), pivot='tree')
+        t2 = time.time()
+        cyclic_jacobi(A1)
+        t3 = time.time()
+        jacobi_serial(A1.copy(), defer_vectors=64)
+        t4 = time.time()
+        print("%-5d %-9.3f %-9.3f %-9.3f %-9.3f" % (P, t1-t0, t2-t1, t3-t2, t4-t3))
+    
     
             
             
@@ -0,0 +1,195 @@
+"""
+Accuracy against speed for every engine and tolerance setting.
+
+Test matrices D = Q1 diag(s) Q2_T (N x P) are built from random
+orthogonal factors and a controlled spectrum s, so the true singular
+values and right singular vectors (the columns of Q2) are known:
+
+  graded          s logspaced from 1 to 1/cond
+  clustered       three clusters (1, 0.5, 0.1) with 1e-9 relative spread
+  rank_deficient  graded first half, exact zeros after
+  ill_conditioned ones with the last few values at 1/cond
+  block_diagonal  graded, with a block-diagonal Q2 (4 blocks) so D_T D
+                  splits into the independent blocks svd_pca_components
+                  solves one by one
+
+Every setting (engine plus options, numpy.linalg.svd as the LAPACK
+baseline) is timed and scored with
+
+  sigma_err       max |sigma - s| / s_1
+  orthogonality   ||U_T U - I||_2
+  reconstruction  ||D - VT_T diag(sigma) U_T||_F / ||D||_F
+  vector_err      max ||u_i - q_i|| after a one-to-one matching of the
+                  true vectors to computed ones (largest total |u_T q|,
+                  scipy's linear_sum_assignment) and fixing the signs,
+                  over the vectors whose relative gap to their
+                  neighbours is above 1e-3 (the others are only defined
+                  up to a rotation inside their cluster)
+  subspace_err    max ||sin theta|| between the computed and true
+                  subspaces of every cluster of equal values (the same
+                  1e-3 gap), which also covers clustered spectra
+
+and the scores are charted against runtime, one panel per metric.
+
+    python validate.py [-o validate.png] [--json validate.json] [--P 48]
+"""
+
+import time
+
+import numpy as np
+
+from benchmark import make_case
+
+
+SPECTRA = ('graded', 'clustered', 'rank_deficient', 'ill_conditioned', 'block_diagonal')
+
+
+def spectrum(kind, P, cond=1e6):
+    if kind in ('graded', 'block_diagonal'):
+        return np.logspace(0, -np.log10(cond), P)
+    if kind == 'clustered':
+        s = np.repeat([1.0, 0.5, 0.1], -(-P // 3))[:P]
+        return s * (1 + 1e-9 * np.arange(P))
+    if kind == 'rank_deficient':
+        s = np.logspace(0, -2, P)
+        s[P // 2:] = 0
+        return s
+    if kind == 'ill_conditioned':
+        s = np.ones(P)
+        s[-max(P // 16, 1):] = 1.0 / cond
+        return s
+    raise ValueError("unknown spectrum %r" % (kind,))
+
+
+def settings():
+    # label -> (dtype of D, function(N, P, D) returning sigma, U, VT)
+    from mixed import svd_pca_mixed
+    from packed import svd_pca_packed
+    from svd_block import svd_pca_block
+    from svd_components import svd_pca_components
+    from svd_cyclic import svd_pca_cyclic
+    from tsqr import svd_pca_tsqr
+    from v1 import svd_pca_serial
+
+    def lapack(N, P, D):
+        u, sigma, vh = np.linalg.svd(D, full_matrices = False)
+        return sigma, vh.T, u.T
+
+    def driver(run, **options):
+        return lambda N, P, D: run(N, P, D, False, **options)[:3]
+
+    return [
+        ('numpy float64', np.float64, lapack),
+        ('numpy float32', np.float32, lapack),
+        ('serial', np.float32, driver(svd_pca_serial)),
+        ('cyclic', np.float32, driver(svd_pca_cyclic)),
+        ('cyclic tol=1e-5', np.float32, driver(svd_pca_cyclic, tol = 1e-5)),
+        ('cyclic tol=1e-3', np.float32, driver(svd_pca_cyclic, tol = 1e-3)),
+        ('cyclic deflate', np.float32, driver(svd_pca_cyclic, deflate = True)),
+        ('block', np.float32, driver(svd_pca_block, block = 16)),
+        ('packed', np.float32, driver(svd_pca_packed)),
+        ('components', np.float32, driver(svd_pca_components)),
+        ('tsqr', np.float32, driver(svd_pca_tsqr)),
+        ('cyclic float64', np.float64, driver(svd_pca_cyclic)),
+        ('mixed', np.float64, driver(svd_pca_mixed)),
+        ('mixed refine=1', np.float64, driver(svd_pca_mixed, refine_sweeps = 1)),
+    ]
+
+
+def scores(D, s, Q2, sigma, U, VT):
+    D, sigma, U, VT = (np.asarray(X, dtype = np.float64) for X in (D, sigma, U, VT))
+    P = len(s)
+    result = {'sigma_err': np.abs(np.sort(sigma)[::-1][:P] - s).max() / s[0],
+              'orthogonality': np.linalg.norm(np.dot(U.T, U) - np.eye(U.shape[1]), 2),
+              'reconstruction': np.linalg.norm(D - np.dot(VT[:P].T * sigma[:P], U[:, :P].T)) / np.linalg.norm(D)}
+    # subspaces of the clusters, with the computed vectors in descending
+    # order of sigma
+    gaps = np.abs(np.diff(s)) / s[0]
+    Us = U[:, np.argsort(sigma)[::-1][:P]]
+    bounds = np.r_[0, np.flatnonzero(gaps > 1e-3) + 1, P]
+    result['subspace_err'] = max(
+        np.linalg.norm(np.dot(Q2[:, a:b], Q2[:, a:b].T) - np.dot(Us[:, a:b], Us[:, a:b].T), 2)
+        for a, b in zip(bounds[:-1], bounds[1:]))
+    # vectors with a clear relative gap to both neighbours
+    gap = np.minimum(np.r_[np.inf, gaps], np.r_[gaps, np.inf])
+    defined = np.flatnonzero((gap > 1e-3) & (s > 0))
+    if len(defined) == 0:
+        result['vector_err'] = float('nan')
+        return result
+    # match the true vectors one-to-one to computed ones (a per-row argmax
+    # can pick the same computed vector twice), then align the signs
+    from scipy.optimize import linear_sum_assignment
+    overlap = np.dot(Q2[:, defined].T, U)
+    rows, match = linear_sum_assignment(-np.abs(overlap))
+    signs = np.sign(overlap[rows, match])
+    err = U[:, match] * signs - Q2[:, defined]
+    result['vector_err'] = np.linalg.norm(err, axis = 0).max()
+    return result
+
+
+def run(N=256, P=48, cond=1e6, repeats=3, log=None):
+    results = []
+    for kind in SPECTRA:
+        # D in float64, s descending, Q2 the right singular vectors
+        s = np.sort(spectrum(kind, P, cond))[::-1]
+        D64, s, Q2 = make_case(N, P, s = s, blocks = 4 if kind == 'block_diagonal' else 1)
+        for label, dtype, solve in settings():
+            D = D64.astype(dtype)
+            best = np.inf
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                sigma, U, VT = solve(N, P, D)
+                best = min(best, time.perf_counter() - t0)
+            result = dict(scores(D64, s, Q2, sigma, U, VT), spectrum = kind, setting = label, time = best)
+            results.append(result)
+            if log is not None:
+                log("%-15s %-16s %8.4fs  sigma %.1e  orth %.1e  recon %.1e  vec %.1e  subspace %.1e" % (
+                    kind, label, best, result['sigma_err'], result['orthogonality'],
+                    result['reconstruction'], result['vector_err'], result['subspace_err']))
+    return results
+
+
+def chart(results, path):
+    # one panel per metric, error against runtime; marker per spectrum,
+    # colour per setting
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    metrics = ('sigma_err', 'orthogonality', 'reconstruction', 'vector_err', 'subspace_err')
+    labels = list(dict.fromkeys(r['setting'] for r in results))
+    colours = dict((label, plt.cm.tab20(i % 20)) for i, label in enumerate(labels))
+    markers = dict(zip(SPECTRA, 'osD^v'))
+    fig, axes = plt.subplots(2, 3, figsize = (15, 9))
+    axes = axes.ravel()
+    for ax, metric in zip(axes, metrics):
+        for r in results:
+            ax.scatter(r['time'], max(r[metric], 1e-17), color = colours[r['setting']],
+                       marker = markers[r['spectrum']])
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('time (s)')
+        ax.set_title(metric)
+    handles = [plt.Line2D([], [], color = colours[label], marker = 'o', linestyle = '') for label in labels]
+    handles += [plt.Line2D([], [], color = 'k', marker = markers[kind], linestyle = '') for kind in SPECTRA]
+    axes[-1].axis('off')
+    axes[-1].legend(handles, labels + list(SPECTRA), loc = 'center', fontsize = 8)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description = "accuracy against runtime of the SVD engines")
+    parser.add_argument('-o', '--output', default = 'validate.png')
+    parser.add_argument('--json')
+    parser.add_argument('--N', type = int, default = 256)
+    parser.add_argument('--P', type = int, default = 48)
+    parser.add_argument('--cond', type = float, default = 1e6)
+    args = parser.parse_args()
+    results = run(args.N, args.P, args.cond, log = print)
+    chart(results, args.output)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent = 1)